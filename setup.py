@@ -26,8 +26,15 @@ setup(
     install_requires=[
         'matplotlib',
         'numpy',
+        'scipy',
         'h5py',
     ],
+    extras_require={
+        'numba': ['numba'],
+        'dask': ['dask'],
+        'mpi': ['mpi4py'],
+        'all': ['numba', 'dask', 'mpi4py'],
+    },
     classifiers=[
         'Development Status :: 3 - Alpha',
         'Intended Audience :: Developers',
@@ -23,6 +23,8 @@ Run with:
 Output
 ---
 *Ez.h5*: Ez 3d matrix for every timestep in HDF5 file format
+*Ez_pipe.h5*: Ez on the beam pipe boundary for every timestep, only with INTEGRATION = 'indirect'
+*Et.h5*: Ex, Ey, Bx, By on the test line, averaged onto the Ez nodes, for every timestep, only with TRANSVERSE = 'lorentz'
 *warpx.inp*: Stores the geometry and simulation input in a dictionary with pickle 
 
 '''
@@ -69,6 +71,10 @@ CFL = 1.0               #Courant-Friedrichs-Levy criterion for stability
 NUM_PROC = 1            #number of mpi processors wanted to use
 UNIT = 1e-3             #conversion factor from input to [m]
 Wake_length=1000*UNIT   #Wake potential length in s [m]
+DUMP_STRIDE = 1         #save Ez every DUMP_STRIDE timesteps, use time_interp='linear' or 'cubic' in wakis if > 1, s is sampled DUMP_STRIDE times coarser
+DTYPE = 'float64'       #precision of the saved Ez field: 'float64' or 'float32'
+INTEGRATION = 'direct'  #'direct' or 'indirect' (Napoly, only for structures with equal beam pipes)
+TRANSVERSE = 'panofsky' #'panofsky' (3x3 Ez stencil) or 'lorentz' (Ex, Ey, Bx, By on the test line only)
 
 # flags
 flag_logfile = False        #generates a .log file with the simulation info
@@ -118,6 +124,13 @@ ylo, yhi = ytest-2*dh, ytest+2*dh
 zlo, zhi = -L/2, -L/2
 flag_mask_pml = False  #removes the pml cells from the E field monitor
 
+# define the beam pipe boundary for the indirect integration 
+# ---[equal pipes of radius PIPE_RADIUS centered in x,y = 0,0]
+# ---[z1, z2: start and end of the structure between the pipes]
+PIPE_RADIUS = 5*UNIT
+NPHI = 8                #number of field lines on the boundary
+z1, z2 = -L/2, L/2
+
 #--------------------------------------------------------------------------------
 
 #==================#
@@ -160,8 +173,32 @@ if flag_mask_pml:
     zmask = np.logical_and(z >= -L/2.0 + n_pml*dz, z <= L/2 - n_pml*dz)
 else:
     zmask = np.logical_and(z >= zlo, z <= zhi)
-xmask = np.logical_and(x >= xlo - dh, x <= xhi + dh)
-ymask = np.logical_and(y >= ylo - dh, y <= yhi + dh)
+
+# Define the integration path for test particle (xtest, ytest)
+ixtest=int((xtest-x[0])/dx)
+iytest=int((ytest-y[0])/dy)
+
+if TRANSVERSE == 'lorentz':
+    # only the test line, the transverse wake comes from the Lorentz force
+    xmask = np.arange(nx) == ixtest
+    ymask = np.arange(ny) == iytest
+else:
+    xmask = np.logical_and(x >= xlo - dh, x <= xhi + dh)
+    ymask = np.logical_and(y >= ylo - dh, y <= yhi + dh)
+
+# points on the beam pipe boundary for the indirect integration,
+# Ez is interpolated bilinearly from the four surrounding nodes
+phi = 2*np.pi*np.arange(NPHI)/NPHI
+fxpipe = np.interp(PIPE_RADIUS*np.cos(phi), x, np.arange(nx))   #fractional node index
+fypipe = np.interp(PIPE_RADIUS*np.sin(phi), y, np.arange(ny))
+ixpipe = np.minimum(fxpipe.astype(int), nx-2)
+iypipe = np.minimum(fypipe.astype(int), ny-2)
+wxpipe, wypipe = fxpipe-ixpipe, fypipe-iypipe
+zmask_pipe = np.logical_and(z >= z1, z <= z2)
+
+if INTEGRATION == 'indirect' and dh > PIPE_RADIUS/5:
+    print('[WARPX][WARNING] Mesh size dh = '+str(dh/UNIT)+' mm is not well below the pipe radius, '+ \
+          'the multipoles of the indirect integration have errors of order dh/PIPE_RADIUS')
 
 #Injection position [TO OPTIMIZE]
 z_inj=zmin+5*dz
@@ -210,7 +247,11 @@ init_time = 8.53*sigmaz/c + (zmin+L/2)/c -z_inj/c #[s] injection time + PEC leng
 dt=CFL*(1/c)/np.sqrt((1/dx)**2+(1/dy)**2+(1/dz)**2)
 
 # timesteps needed to simulate
-max_steps=int((Wake_length+init_time*c+(zmax-zmin))/dt/c)
+if INTEGRATION == 'indirect':
+    # only until the test particle leaves the structure at z2
+    max_steps=int((Wake_length+init_time*c+(z2-zmin))/dt/c)
+else:
+    max_steps=int((Wake_length+init_time*c+(zmax-zmin))/dt/c)
 
 print('[WARPX][INFO] Timesteps to simulate = '+ str(max_steps) + ' with timestep dt = ' + str(dt))
 print('[WARPX][INFO] Wake length = '+str(Wake_length/UNIT)+ ' mm')
@@ -321,9 +362,28 @@ if os.path.exists(path+hf_name):
 
 hf_Ez = h5py.File(path+hf_name, 'w')
 
-# Define the integration path for test particle (xtest, ytest)
-ixtest=int((xtest-x[0])/dx)
-iytest=int((ytest-y[0])/dy)
+if INTEGRATION == 'indirect':
+    if os.path.exists(path+'Ez_pipe.h5'):
+        os.remove(path+'Ez_pipe.h5')
+    hf_pipe = h5py.File(path+'Ez_pipe.h5', 'w')
+
+if TRANSVERSE == 'lorentz':
+    if os.path.exists(path+'Et.h5'):
+        os.remove(path+'Et.h5')
+    hf_Et = h5py.File(path+'Et.h5', 'w')
+
+    # Yee staggering of Ex, Ey, Bx, By from the Ez node (i, j, k+1/2), in half cells along x, y, z:
+    # Ex, By sit half a cell up in x, Ey, Bx half a cell up in y, Ex, Ey half a cell down in z
+    Et_stagger = [(1, 0, 1), (0, 1, 1), (0, 1, 0), (1, 0, 0)]
+
+    def on_Ez_node(F, sx, sy, sz):
+        '''
+        Averages the field F of the Yee grid onto the Ez nodes of the 
+        test line from its two neighbours along every staggered direction
+        '''
+        F = F[ixtest-sx:ixtest+1, iytest-sy:iytest+1].mean(axis=(0, 1))
+        return (F[:nz]+F[1:nz+1])/2 if sz else F[:nz]
+
 print('[WARPX][INFO] Field will be extracted around ('+str(round(x[ixtest]/UNIT,3))+','+str(round(y[iytest]/UNIT,3))+',z,t) [mm]')
 
 # Define number for datasets title
@@ -352,15 +412,34 @@ for n_step in range(max_steps):
     # Extraxt the timestep size
     dt = libwarpx.libwarpx_so.warpx_getdt(0)
 
-    # append to t, rho lists
-    t.append(n_step*dt)
+    # append to rho list
     rho_t.append(rho[ixsource,iysource,:])
 
+    # Only one frame every DUMP_STRIDE timesteps is saved
+    if n_step % DUMP_STRIDE != 0:
+        continue
+
+    # append to t list
+    t.append(n_step*dt)
+
     # Save the 3D Ez matrix into a hdf5 dataset
     #hf_Ez.create_dataset('Ez_'+prefix[n_step]+str(n_step), data=Ez[:,:,zmask])
 
     # Saves the Ez field in a prism along the z axis 3 cells wide into a hdf5 dataset
-    hf_Ez.create_dataset('Ez_'+prefix[n_step]+str(n_step), data=Ez[xmask, ymask, zmask] )
+    hf_Ez.create_dataset('Ez_'+prefix[n_step]+str(n_step), data=Ez[xmask, ymask, zmask].astype(DTYPE) )
+
+    # Saves the Ez field on the NPHI boundary lines [NPHI, nz] for the indirect integration
+    if INTEGRATION == 'indirect':
+        Ez_pipe = ((1-wxpipe)*(1-wypipe))[:, None]*Ez[ixpipe, iypipe] + (wxpipe*(1-wypipe))[:, None]*Ez[ixpipe+1, iypipe] \
+                + ((1-wxpipe)*wypipe)[:, None]*Ez[ixpipe, iypipe+1] + (wxpipe*wypipe)[:, None]*Ez[ixpipe+1, iypipe+1]
+        hf_pipe.create_dataset('Ez_'+prefix[n_step]+str(n_step), data=Ez_pipe[:, zmask_pipe].astype(DTYPE) )
+
+    # Saves Ex, Ey, Bx, By on the test line [4, nz] for the Lorentz transverse wake,
+    # averaged onto the Ez nodes from their neighbours along the staggered directions
+    if TRANSVERSE == 'lorentz':
+        Et = [fields.ExWrapper(), fields.EyWrapper(), fields.BxWrapper(), fields.ByWrapper()]
+        Et = np.array([on_Ez_node(F.get_fabs(0,2,include_ghosts=False)[0], *s) for F, s in zip(Et, Et_stagger)])
+        hf_Et.create_dataset('Et_'+prefix[n_step]+str(n_step), data=Et[:, zmask].astype(DTYPE) )
 
 # Finish simulation --------------------------------------------
 
@@ -371,6 +450,10 @@ print('[WARPX][PROGRESS] Run terminated in %ds' %totalt)
 
 # Close the hdf5 files
 hf_Ez.close()
+if INTEGRATION == 'indirect':
+    hf_pipe.close()
+if TRANSVERSE == 'lorentz':
+    hf_Et.close()
 
 #Create np.arrays
 rho_t=np.transpose(np.array(rho_t)) #(z,t)
@@ -396,7 +479,14 @@ data = { 'init_time' : -t_offs,
          'x' : x[xmask],   
          'y' : y[ymask],
          'z' : z[zmask],
-         'nt' : max_steps,
+         'nt' : len(t),      #saved frames, max_steps/DUMP_STRIDE
+         'dump_stride' : DUMP_STRIDE,
+         'dtype' : DTYPE,
+         'integration' : INTEGRATION,
+         'transverse' : TRANSVERSE,
+         'pipe_radius' : PIPE_RADIUS,
+         'phi' : phi,
+         'zpipe' : z[zmask_pipe],
          'nx' : nx,
          'ny' : ny,
          'nz' : nz,
@@ -0,0 +1,28 @@
+# check of the chunked out-of-core wake integration against the in-memory one
+# run with: python chunked_solve.py
+
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic import mesh, mode, write_Ez, solver, check
+
+#path to files
+path = os.getcwd() + '/'
+
+x, y, z, t = mesh()
+write_Ez(path+'Ez_chunked.h5', mode(x, y, z, t), len(t))
+w = solver(path+'Ez_chunked.h5', x, y, z, t)
+
+for grid in ['interp', 'native']:
+    WP, i0, j0 = w.calc_long_WP(grid=grid)
+
+    # budgets well below the working set, Ez is streamed in blocks of timesteps
+    for budget in [4e6, 1e6]:
+        WP_chunked, i0, j0 = w.calc_long_WP(grid=grid, memory_budget=budget)
+        check('grid '+grid+' with a memory budget of '+str(budget/1e6)+' MB, identical to in-memory',
+              np.array_equal(WP_chunked, WP))
+
+w.Ez['hf'].close()
+os.remove(path+'Ez_chunked.h5')
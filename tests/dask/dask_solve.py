@@ -0,0 +1,36 @@
+# check of the dask engine against the numpy one
+# run with: python dask_solve.py
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic import DH, mesh, mode, write_Ez, solver, rel, check
+
+#path to files
+path = os.getcwd() + '/'
+
+x, y, z, t = mesh()
+
+if __name__ == '__main__':
+    # the processes scheduler spawns workers that import this script
+
+    write_Ez(path+'Ez_dask.h5', mode(x, y, z, t, h=lambda X, Y: 1+X/DH/10+Y/DH/20), len(t))
+    w = solver(path+'Ez_dask.h5', x, y, z, t)
+
+    for grid in ['interp', 'native']:
+        WP, i0, j0 = w.calc_long_WP(grid=grid)
+        WP_dask, i0, j0 = w.calc_long_WP(grid=grid, engine='dask')
+        err = rel(WP_dask.compute(), WP)
+        check('grid '+grid+' lazy '+type(WP_dask).__name__+', relative difference to numpy '+str(err), err < 1e-12)
+
+    # whole solve, the task graph of every result runs on the scheduler
+    w.solve()
+    ref = {k: getattr(w, k).copy() for k in ['WP', 'WPx', 'WPy', 'Z', 'Zx', 'Zy']}
+    for scheduler in ['threads', 'processes', 'synchronous']:
+        w.solve(engine='dask', scheduler=scheduler)
+        err = max(rel(getattr(w, k), ref[k]) for k in ref)
+        check('solve on the '+scheduler+' scheduler, max relative difference to numpy '+str(err), err < 1e-12)
+
+    w.Ez['hf'].close()
+    os.remove(path+'Ez_dask.h5')
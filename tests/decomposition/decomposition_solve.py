@@ -0,0 +1,61 @@
+# check of the dipolar and quadrupolar decomposition of a scan along one plane
+# run with: python decomposition_solve.py
+
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic import DH, mesh, mode, write_Ez, open_Ez, inputs, rel, check
+
+import wakis
+from wakis.decomposition import _offset_fit
+
+#path to files
+path = os.getcwd() + '/'
+
+#offset of the runs
+d = 2*DH
+
+def run(xsource, xtest):
+    '''
+    Writes the synthetic Ez field of a run displaced in x only: a 
+    decaying mode with a term linear in the source offset and a 
+    quadrupolar term, and returns its `Wakis` keyword arguments
+    '''
+    x, y, z, t = mesh(x0=xtest)
+    h = lambda X, Y: 1+xsource*X/DH**2/10+(X**2-Y**2)/DH**2/100
+
+    filename = 'Ez_%g_%g.h5' % (xsource/DH, xtest/DH)
+    write_Ez(path+filename, mode(x, y, z, t, h=h), len(t))
+
+    return inputs(x, y, z, t, Ez=path+filename, xsource=xsource, ysource=0.0, xtest=xtest, ytest=0.0)
+
+def solved(spec):
+    w = wakis.Wakis(**dict(spec, Ez=open_Ez(spec['Ez']), log=wakis.logger.get_logger(level=3)))
+    w.solve()
+    w.Ez['hf'].close()
+    return w
+
+if __name__ == '__main__':
+    # the runs are solved in spawned processes that import this script
+
+    # fit operator of the planes: determined in x, no offset in y
+    check('fit of a plane displaced by the runs', _offset_fit(np.array([0, d, 0]), np.array([0, 0, d])) is not None)
+    check('no fit of a plane the runs do not displace', _offset_fit(np.zeros(3), np.zeros(3)) is None)
+    check('no fit of a plane where source and test move together', _offset_fit(np.array([0, d]), np.array([0, d])) is None)
+
+    # scan along x only, the y terms are left undetermined
+    runs = [run(0, 0), run(d, 0), run(0, d)]
+    D = wakis.Decomposition(runs, workers=2).solve()
+    check('y plane not fitted', D.WPy is None and D.Zy is None)
+
+    # the x terms are the differences of the displaced runs to the centered one
+    w = [solved(spec) for spec in runs]
+    for key in ['WPx', 'Zx']:
+        dip, quad = (getattr(w[1], key)-getattr(w[0], key))/d, (getattr(w[2], key)-getattr(w[0], key))/d
+        err = max(rel(getattr(D, key)['dipolar'], dip), rel(getattr(D, key)['quadrupolar'], quad))
+        check(key+' dipolar and quadrupolar terms, relative difference to the displaced runs '+str(err), err < 1e-10)
+
+    for spec in runs:
+        os.remove(spec['Ez'])
@@ -0,0 +1,35 @@
+# check of the MPI wake solver against the serial one
+# run with: mpirun -n 4 python mpi_solve.py
+
+import os
+import sys
+import numpy as np
+from mpi4py import MPI
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic import mesh, mode, write_Ez, solver, check
+
+comm = MPI.COMM_WORLD
+rank = comm.Get_rank()
+
+#path to files
+path = os.getcwd() + '/'
+
+x, y, z, t = mesh()
+if rank == 0:
+    write_Ez(path+'Ez_mpi.h5', mode(x, y, z, t), len(t))
+comm.Barrier()
+
+w = solver(path+'Ez_mpi.h5', x, y, z, t)
+
+for grid in ['interp', 'native']:
+    WP_mpi, i0, j0 = w.calc_long_WP(grid=grid, mpi=True)
+
+    if rank == 0:
+        WP, i0, j0 = w.calc_long_WP(grid=grid)
+        check('grid '+grid+' on '+str(comm.Get_size())+' ranks, identical to serial', np.array_equal(WP_mpi, WP))
+
+w.Ez['hf'].close()
+comm.Barrier()
+if rank == 0:
+    os.remove(path+'Ez_mpi.h5')
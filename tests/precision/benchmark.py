@@ -0,0 +1,62 @@
+# benchmark of the float32 field pipeline against float64
+# run with: python benchmark.py
+
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic import mesh, mode, write_Ez, solver, rel, check
+
+#path to files
+path = os.getcwd() + '/'
+
+#relative noise level of the PIC field
+noise = 1e-2
+
+x, y, z, t = mesh(nt=1500, nz=300)
+
+def solve(filename, dtype, grid):
+    '''
+    Runs the longitudinal wake integration and returns the
+    wake potential, elapsed time and peak memory
+    '''
+    w = solver(path+filename, x, y, z, t)
+
+    tracemalloc.start()
+    t0 = time.time()
+    WP_3d, i0, j0 = w.calc_long_WP(grid=grid, dtype=dtype)
+    t1 = time.time()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    w.Ez['hf'].close()
+
+    return WP_3d[i0, j0, :], t1-t0, peak
+
+# synthetic Ez field plus random noise, stored in both precisions
+for dtype in ['float64', 'float32']:
+    rng = np.random.default_rng(0)
+    field = mode(x, y, z, t)
+    write_Ez(path+'Ez_'+dtype+'.h5', lambda n: field(n)+noise*rng.standard_normal((len(x), len(y), len(z))),
+             len(t), dtype=dtype)
+
+print('Ez.h5 size: float64 '+str(round(os.path.getsize(path+'Ez_float64.h5')/1e6, 1))+' MB, '+
+      'float32 '+str(round(os.path.getsize(path+'Ez_float32.h5')/1e6, 1))+' MB')
+
+for grid in ['interp', 'native']:
+    WP64, t64, m64 = solve('Ez_float64.h5', 'float64', grid)
+    WP32, t32, m32 = solve('Ez_float32.h5', 'float32', grid)
+    err = rel(WP32, WP64)
+
+    print('grid '+grid+': float64 '+str(round(t64, 2))+' s '+str(round(m64/1e6, 1))+' MB, '+
+          'float32 '+str(round(t32, 2))+' s '+str(round(m32/1e6, 1))+' MB, '+
+          'speedup x'+str(round(t64/t32, 2)))
+
+    # the wake is accumulated in float64, only the rounding of Ez to float32 is left
+    check('grid '+grid+' float32 relative error '+str(err), err < 1e-6)
+    check('grid '+grid+' float32 peak memory below float64', m32 < m64)
+
+for dtype in ['float64', 'float32']:
+    os.remove(path+'Ez_'+dtype+'.h5')
@@ -0,0 +1,50 @@
+# check of the resumed wake integration against the uninterrupted one
+# run with: python resume_solve.py
+
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic import mesh, mode, write_Ez, open_Ez, solver, check
+
+from wakis.reader import Reader
+from wakis.solver import WakeAccumulator
+
+#path to files
+path = os.getcwd() + '/'
+
+x, y, z, t = mesh(nt=900)
+nt = len(t)
+field = mode(x, y, z, t)
+
+# timesteps stored when the first integration runs
+nt1 = 700
+
+for grid in ['interp', 'native']:
+    for file in ['Ez_resume.h5', 'state.npz']:
+        if os.path.exists(path+file): os.remove(path+file)
+
+    # first run on the timesteps simulated so far
+    write_Ez(path+'Ez_resume.h5', field, nt1)
+    w = solver(path+'Ez_resume.h5', x, y, z, t[:nt1])
+    WP1, i0, j0 = w.calc_long_WP_stream(grid=grid, state=path+'state.npz')
+    w.Ez['hf'].close()
+
+    # the simulation goes on, the new timesteps are appended and only they are read
+    write_Ez(path+'Ez_resume.h5', field, nt, n0=nt1, mode='a')
+    w.Ez, w.t = open_Ez(path+'Ez_resume.h5'), t
+    WP2, i0, j0 = w.calc_long_WP_stream(grid=grid, state=path+'state.npz')
+
+    # uninterrupted integration of every timestep on the same s
+    acc = WakeAccumulator.load(path+'state.npz')
+    ref = WakeAccumulator(acc.z, acc.s, acc.t0, acc.dt, acc.ti, zk=acc.zk if grid == 'interp' else None, shape=acc.shape)
+    ref.consume(Reader.iter_Ez_prism(w.Ez['hf'], w.Ez['dataset']))
+
+    check('grid '+grid+' resumed at timestep '+str(nt1)+', identical to uninterrupted', np.array_equal(acc.WP, ref.WP))
+    check('grid '+grid+' wake length extended from '+str(len(WP1[i0, j0]))+' to '+str(len(WP2[i0, j0]))+ \
+          ' samples, first ones unchanged', np.array_equal(WP1, WP2[:, :, :WP1.shape[-1]]))
+    w.Ez['hf'].close()
+
+os.remove(path+'Ez_resume.h5')
+os.remove(path+'state.npz')
@@ -0,0 +1,33 @@
+# check of the streaming wake integration against the one-shot one
+# run with: python stream_solve.py
+
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic import mesh, mode, write_Ez, solver, check
+
+#path to files
+path = os.getcwd() + '/'
+
+x, y, z, t = mesh()
+nx, ny, nt = len(x), len(y), len(t)
+field = mode(x, y, z, t)
+write_Ez(path+'Ez_stream.h5', field, nt)
+w = solver(path+'Ez_stream.h5', x, y, z, t)
+
+for grid in ['interp', 'native']:
+    WP, i0, j0 = w.calc_long_WP(grid=grid)
+
+    # slices read one timestep at a time from Ez.h5
+    WP_stream, i0, j0 = w.calc_long_WP_stream(grid=grid)
+    check('grid '+grid+' streamed from Ez.h5, identical to one-shot', np.array_equal(WP_stream, WP))
+
+    # slices from a live producer, e.g. the field solver
+    producer = (field(n)[nx//2-1:nx//2+2, ny//2-1:ny//2+2] for n in range(nt))
+    WP_live, i0, j0 = w.calc_long_WP_stream(slices=producer, grid=grid)
+    check('grid '+grid+' streamed from a producer, identical to one-shot', np.array_equal(WP_live, WP))
+
+w.Ez['hf'].close()
+os.remove(path+'Ez_stream.h5')
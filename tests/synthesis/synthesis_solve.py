@@ -0,0 +1,68 @@
+# check of the superposition synthesis of the wakes for arbitrary offsets
+# run with: python synthesis_solve.py
+
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic import DH, mesh, mode, write_Ez, open_Ez, inputs, rel, check
+
+import wakis
+
+#path to files
+path = os.getcwd() + '/'
+
+#offset of the runs
+d = 2*DH
+
+def run(xsource, ysource, xtest, ytest):
+    '''
+    Writes the synthetic Ez field of a run around its test position:
+    a decaying mode with a term linear in the source offset and a
+    quadrupolar term, and returns its `Wakis` keyword arguments
+    '''
+    x, y, z, t = mesh(x0=xtest, y0=ytest)
+    h = lambda X, Y: 1+(xsource*X+ysource*Y)/DH**2/10+(X**2-Y**2)/DH**2/100
+
+    filename = 'Ez_%g_%g_%g_%g.h5' % (xsource/DH, ysource/DH, xtest/DH, ytest/DH)
+    write_Ez(path+filename, mode(x, y, z, t, h=h), len(t))
+
+    return inputs(x, y, z, t, Ez=path+filename, xsource=xsource, ysource=ysource, xtest=xtest, ytest=ytest)
+
+def solved(spec):
+    w = wakis.Wakis(**dict(spec, Ez=open_Ez(spec['Ez']), log=wakis.logger.get_logger(level=3)))
+    w.solve()
+    w.Ez['hf'].close()
+    return w
+
+if __name__ == '__main__':
+    # the runs are solved in spawned processes that import this script
+
+    runs = [run(0, 0, 0, 0), run(d, 0, 0, 0), run(0, d, 0, 0), run(0, 0, d, 0), run(0, 0, 0, d)]
+    test = run(d/2, -d, d, d/2)
+
+    # fit from the field dumps, solved in a pool of processes
+    S = wakis.Synthesis(runs, workers=2).fit()
+
+    # same fit from already solved runs
+    S_solved = wakis.Synthesis([solved(spec) for spec in runs]).fit()
+    check('fit from solved runs identical to the fit from the field dumps',
+          all(np.array_equal(S.C[k], S_solved.C[k]) for k in S.keys))
+
+    # offset not in the basis runs: exact for the transverse results, WP and Z 
+    # miss the second order terms of the offsets
+    w = solved(test)
+    out = S(test['xsource'], test['ysource'], test['xtest'], test['ytest'])
+    for k in S.keys:
+        err = rel(out[k], getattr(w, k))
+        check(k+' of an offset outside the runs, relative error '+str(err), err < (1e-12 if k[-1] in 'xy' else 2e-2))
+
+    # coefficients cached on disk
+    S.save(path+'synthesis.npz')
+    S_loaded = wakis.Synthesis.load(path+'synthesis.npz')
+    check('loaded synthesis identical', all(np.array_equal(S_loaded(d, d, 0, 0)[k], S(d, d, 0, 0)[k]) for k in S.keys))
+
+    for spec in runs+[test]:
+        os.remove(spec['Ez'])
+    os.remove(path+'synthesis.npz')
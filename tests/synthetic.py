@@ -0,0 +1,97 @@
+'''
+Synthetic Ez fields shared by the check scripts of the tests folders
+
+Every check writes a small field monitor in the Ez.h5 format of
+WarpX, integrates it with wakis and asserts its comparisons, so a
+regression makes the script fail. Import it from a script in a
+tests/<folder>/ with:
+
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from synthetic import mesh, mode, write_Ez, solver, check
+'''
+
+import os
+import numpy as np
+import h5py
+from scipy.constants import c
+
+import wakis
+from wakis.reader import Reader
+
+#mesh size
+DH = 1e-3
+
+#bunch parameters
+Q = 1e-9
+SIGMAZ = 10*DH
+
+def mesh(nt=600, nx=5, ny=5, nz=200, dh=DH, x0=0.0, y0=0.0):
+    '''
+    Coordinates x, y, z of a field monitor of nx*ny lines of nz
+    cells of size dh around (x0, y0), and nt timesteps at the
+    CFL limit of the mesh
+    '''
+    x = x0+(np.arange(nx)-nx//2)*dh
+    y = y0+(np.arange(ny)-ny//2)*dh
+    z = np.linspace(-nz*dh/2, nz*dh/2, nz)
+    t = np.arange(nt)*dh/c/np.sqrt(3)
+
+    return x, y, z, t
+
+def mode(x, y, z, t, h=None):
+    '''
+    Synthetic Ez field of a decaying 3 GHz mode excited by the bunch
+    in the middle of the structure, with the transverse profile h(X, Y),
+    1+X/(10*DH) by default. Returns the field of the timestep n,
+    Ez(n) [nx, ny, nz]
+    '''
+    X, Y, Z = np.meshgrid(x, y, z, indexing='ij')
+    H = 1+X/DH/10 if h is None else h(X, Y)
+    L = max(z)-min(z)
+
+    return lambda n: np.cos(2*np.pi*3e9*(t[n]-Z/c))*np.exp(-t[n]/2e-9)*H*np.exp(-(Z/(L/4))**2)
+
+def write_Ez(file, field, nt, n0=0, prefix='Ez_', mode='w', dtype=None):
+    '''
+    Writes the datasets field(n) of the timesteps [n0, nt) in the
+    h5 file, named as WarpX does, in the given dtype
+    '''
+    with h5py.File(file, mode) as hf:
+        for n in range(n0, nt):
+            zeros = '0'*5 if n == 0 else '0'*(5-int(np.log10(n)))
+            hf.create_dataset(prefix+zeros+str(n), data=np.asarray(field(n), dtype=dtype))
+
+def open_Ez(file):
+    '''
+    Opens the h5 file of a field, as the `Ez` attribute of Wakis
+    '''
+    hf, dataset = Reader.read_Ez(os.path.dirname(file)+'/', os.path.basename(file))
+
+    return {'hf' : hf, 'dataset' : dataset}
+
+def inputs(x, y, z, t, sigmaz=SIGMAZ, **kwargs):
+    '''
+    Keyword arguments of `wakis.Wakis` for the synthetic field:
+    beam, field monitor and charge distribution
+    '''
+    return dict(q=Q, sigmaz=sigmaz, t=t, x=x, y=y, z=z, unit_m=1e-3,
+                chargedist=np.exp(-z**2/2/sigmaz**2)*Q/sigmaz, **kwargs)
+
+def solver(file, x, y, z, t, **kwargs):
+    '''
+    Wakis object on the field stored in the h5 file
+    '''
+    return wakis.Wakis(Ez=open_Ez(file), log=wakis.logger.get_logger(level=3), **inputs(x, y, z, t, **kwargs))
+
+def rel(a, b):
+    '''
+    Maximum difference of a to b relative to the maximum of b
+    '''
+    return np.max(abs(np.asarray(a)-np.asarray(b)))/np.max(abs(np.asarray(b)))
+
+def check(name, ok):
+    '''
+    Prints the outcome of a comparison and fails if it does not hold
+    '''
+    print(name+(': ok' if ok else ': FAILED'))
+    assert ok, AssertionError(name)
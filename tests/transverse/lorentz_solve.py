@@ -0,0 +1,51 @@
+# check of the transverse wake from the Lorentz force against Panofsky-Wenzel
+# run with: python lorentz_solve.py
+
+import os
+import sys
+import numpy as np
+from scipy.constants import c
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic import mesh, write_Ez, open_Ez, solver, rel, check
+
+#path to files
+path = os.getcwd() + '/'
+
+# synthetic fields from a vector potential A = (0, 0, Az): Ez = -dAz/dt,
+# Bx = dAz/dy, By = -dAz/dx, Ex = Ey = 0, so both routes give the same wake.
+# The field rises after the first s, where the running integral of Panofsky-Wenzel starts
+t1, tau, k = 0.3/c, 0.06/c, 100.0
+f = lambda X, Y: 1+50*X+30*Y+1e3*X*Y
+fx = lambda X, Y: 50+1e3*Y
+fy = lambda X, Y: 30+1e3*X
+h = lambda Z, T: np.exp(-((T-t1)/tau)**2)*np.cos(k*Z)*np.exp(-(Z/0.03)**2)
+ht = lambda Z, T: -2*(T-t1)/tau**2*h(Z, T)
+
+def solve(dh):
+    x, y, z, t = mesh(nt=int(0.8/dh), nz=int(0.12/dh), dh=dh)
+    X, Y, Z = np.meshgrid(x, y, z, indexing='ij')
+    write_Ez(path+'Ez_lorentz.h5', lambda n: -f(X, Y)*ht(Z, t[n]), len(t))
+    write_Ez(path+'Et_lorentz.h5', lambda n: np.array([0*z, 0*z, fy(0, 0)*h(z, t[n]), -fx(0, 0)*h(z, t[n])]),
+             len(t), prefix='Et_')
+
+    WPx = {}
+    for transverse in ['panofsky', 'lorentz']:
+        w = solver(path+'Ez_lorentz.h5', x, y, z, t, sigmaz=5e-3, Et=open_Ez(path+'Et_lorentz.h5'))
+        w.solve(grid='native', transverse=transverse, rule='simpson')
+        WPx[transverse] = w.WPx
+        w.Ez['hf'].close()
+        w.Et['hf'].close()
+
+    os.remove(path+'Ez_lorentz.h5')
+    os.remove(path+'Et_lorentz.h5')
+
+    return rel(WPx['lorentz'], WPx['panofsky'])
+
+# the running integral of Panofsky-Wenzel uses the Simpson rule, the two routes differ by 
+# the sampling of the nearest frame in time, first order in the mesh size
+err = [solve(dh) for dh in [2e-3, 1e-3]]
+for dh, e in zip([2e-3, 1e-3], err):
+    check('mesh size '+str(dh*1e3)+' mm, relative difference of WPx lorentz to panofsky '+str(e), e < 30*dh)
+p = np.log2(err[0]/err[1])
+check('difference decreasing with the mesh size, order '+str(round(p, 2)), p > 0.8)
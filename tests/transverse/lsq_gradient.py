@@ -0,0 +1,52 @@
+# check of the least-squares transverse gradient over the whole stencil
+# run with: python lsq_gradient.py
+
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic import DH, mesh, mode, write_Ez, solver, rel, check
+
+#path to files
+path = os.getcwd() + '/'
+
+#relative noise level of the PIC field
+noise = 5e-2
+
+x, y, z, t = mesh(nx=7, ny=7)
+
+# synthetic Ez field: a decaying mode with dipolar and quadrupolar terms
+field = mode(x, y, z, t, h=lambda X, Y: 1+X/DH/10+Y/DH/20+(X*Y+X**2-Y**2)/DH**2/100)
+
+def solve(level):
+    rng = np.random.default_rng(0)
+    write_Ez(path+'Ez_lsq.h5', lambda n: field(n)+level*rng.standard_normal((len(x), len(y), len(z))), len(t))
+    w = solver(path+'Ez_lsq.h5', x, y, z, t)
+
+    WPx = {}
+    for name, i0, gradient in [('centered 3x3', 1, 'centered'), ('lsq 3x3', 1, 'lsq'),
+                               ('lsq 5x5', 2, 'lsq'), ('lsq 7x7', 3, 'lsq')]:
+        WP, i0, j0 = w.calc_long_WP(i0=i0, j0=i0)
+        w.calc_trans_WP(WP, i0, j0, gradient=gradient)
+        WPx[name] = w.WPx
+
+    w.Ez['hf'].close()
+    os.remove(path+'Ez_lsq.h5')
+
+    return WPx
+
+# noiseless field: the fit of a linear gradient is exact
+ref = solve(0.0)
+noisy = solve(noise)
+
+WPx = ref['centered 3x3']
+for name in ref:
+    err = rel(ref[name], WPx)
+    check(name+' relative difference to centered without noise '+str(err), err < 1e-12)
+
+# with noise, the fit over a wider stencil averages it out
+err = [rel(noisy[name], WPx) for name in ref]
+for name, e in zip(ref, err):
+    print(name+' relative error with noise: '+str(e))
+check('relative error with noise decreasing with the stencil', all(np.diff(err) < 0))
@@ -0,0 +1,52 @@
+# check of the Panofsky-Wenzel running integral in linear time
+# run with: python pw_integral.py
+
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic import DH, mesh, mode, write_Ez, solver, rel, check
+
+from wakis.solver import _cumulative
+
+#path to files
+path = os.getcwd() + '/'
+
+x, y, z, t = mesh()
+write_Ez(path+'Ez_pw.h5', mode(x, y, z, t, h=lambda X, Y: 1+X/DH/10+Y/DH/20), len(t))
+w = solver(path+'Ez_pw.h5', x, y, z, t)
+
+# order of the cumulative rules on a smooth function with known integral
+f = lambda s: np.sin(s)*np.exp(-s/3)
+F = lambda s: 0.3*(3 - np.exp(-s/3)*(np.sin(s)+3*np.cos(s)))
+for rule, order in [('rectangle', 1), ('trapezoid', 2), ('simpson', 4)]:
+    err = []
+    for ns in [201, 401]:
+        s = np.linspace(0, 3, ns)
+        err.append(np.max(abs(_cumulative(f(s), s[1]-s[0], rule)-F(s))))
+    p = np.log2(err[0]/err[1])
+    check(rule+' rule, error '+str(err[1])+', order '+str(round(p, 2)), abs(p-order) < 0.1)
+
+# transverse wake against the former quadratic loop over s
+WP, i0, j0 = w.calc_long_WP()
+ds, dx, dy = w.s[1]-w.s[0], x[1]-x[0], y[1]-y[0]
+int_WP = np.array([[[np.sum(WP[i, j, 0:n])*ds for n in range(len(w.s))] for j in range(3)] for i in range(3)])
+WPx = -(int_WP[2, 1]-int_WP[0, 1])/(2*dx)
+WPy = -(int_WP[1, 2]-int_WP[1, 0])/(2*dy)
+
+w.calc_trans_WP(WP, i0, j0)
+err = max(rel(w.WPx, WPx), rel(w.WPy, WPy))
+check('rectangle rule, relative difference of WPx, WPy to the quadratic loop '+str(err), err < 1e-12)
+
+# transverse wake swept in the same pass as the integration, on both grids and chunked
+for kw in [dict(), dict(grid='native'), dict(memory_budget=1e6)]:
+    WP, i0, j0 = w.calc_long_WP(**kw)
+    w.calc_trans_WP(WP, i0, j0, rule='simpson')
+    WPx, WPy = w.WPx, w.WPy
+    w.calc_long_WP(trans=True, rule='simpson', **kw)
+    check(str(kw)+' WPx, WPy from the integration pass identical to calc_trans_WP',
+          np.array_equal(w.WPx, WPx) and np.array_equal(w.WPy, WPy))
+
+w.Ez['hf'].close()
+os.remove(path+'Ez_pw.h5')
@@ -0,0 +1,28 @@
+# check of the per-segment z contributions to the wake potential
+# run with: python zbins_solve.py
+
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic import mesh, mode, write_Ez, solver, rel, check
+
+#path to files
+path = os.getcwd() + '/'
+
+x, y, z, t = mesh()
+write_Ez(path+'Ez_zbins.h5', mode(x, y, z, t), len(t))
+w = solver(path+'Ez_zbins.h5', x, y, z, t)
+
+for kw in [dict(), dict(grid='native'), dict(memory_budget=1e6), dict(time_interp='linear')]:
+    WP, i0, j0 = w.calc_long_WP(**kw)
+    WP_bins, i0, j0 = w.calc_long_WP(zbins=8, **kw)
+    check(str(kw)+' wake potential identical with zbins', np.array_equal(WP_bins, WP))
+
+    # the bins cover the whole structure, their sum is the wake potential
+    err = rel(w.WPz.sum(axis=0), w.WP)
+    check(str(kw)+' relative error of the sum of '+str(w.WPz.shape[0])+' bins '+str(err), err < 1e-12)
+
+w.Ez['hf'].close()
+os.remove(path+'Ez_zbins.h5')
@@ -0,0 +1,42 @@
+# check of the integration weights of non-uniform z grids
+# run with: python zmesh_solve.py
+
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic import mesh, mode, write_Ez, solver, rel, check
+
+from wakis.solver import _is_uniform, _z_weights
+
+#path to files
+path = os.getcwd() + '/'
+
+x, y, z, t = mesh()
+dz = z[2]-z[1]
+
+# z exported with 5 decimals, as the ascii files of CST: not uniform to
+# rounding anymore, its weights must stay the spacing of the cells
+zr = np.round(z, 5)
+w = _z_weights(zr)
+check('rounded grid classified non-uniform', not _is_uniform(zr))
+check('weights of the rounded grid within the rounding of dz, max difference '+str(np.max(abs(w-dz))),
+      np.max(abs(w-dz)) <= 2e-5)
+check('sum of the weights of the rounded grid '+str(w.sum())+' to the uniform one '+str(len(z)*dz),
+      abs(w.sum()-len(z)*dz) <= 1e-5)
+
+# wake potential on the rounded grid against the uniform one
+WP = {}
+for name, zn in [('uniform', z), ('rounded', zr)]:
+    write_Ez(path+'Ez_zmesh.h5', mode(x, y, zn, t), len(t))
+    w = solver(path+'Ez_zmesh.h5', x, y, zn, t)
+    for grid in ['interp', 'native']:
+        WP[name, grid] = w.calc_long_WP(grid=grid)[0]
+    w.Ez['hf'].close()
+
+for grid in ['interp', 'native']:
+    err = rel(WP['rounded', grid], WP['uniform', grid])
+    check('grid '+grid+' relative difference of the wake on the rounded grid to the uniform one '+str(err), err < 1e-3)
+
+os.remove(path+'Ez_zmesh.h5')
@@ -4,6 +4,8 @@ from . import plotting
 from . import solver
 from . import main
 from . import reader
+from . import decomposition
 
 from .main import Wakis
 from .inputs import Inputs
+from .decomposition import Decomposition, Synthesis
@@ -0,0 +1,306 @@
+'''
+Decomposition module to separate the dipolar and
+quadrupolar transverse wakes and impedances from
+several runs with source and test offsets, and to 
+synthesize the wakes of any offset from them
+
+In the ultra-relativistic linear regime the transverse
+wake of a run is linear in the source and test offsets,
+
+    WPx(s) = WPx_0(s) + xsource*WPx_dip(s) + xtest*WPx_quad(s)
+
+and likewise in y. The driving wake (source and test
+displaced together) is WPx_dip + WPx_quad and the
+detuning wake (test displaced only) is WPx_quad.
+'''
+
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from wakis.reader import Reader
+from wakis.logger import get_logger
+
+class Decomposition():
+    '''
+    Dipolar and quadrupolar decomposition over a set of runs.
+    Every run reads its Ez.h5 file once, and the runs are solved
+    concurrently in a pool of processes
+
+    Parameters
+    ----------
+    runs : list
+        Runs with their offsets, as `Wakis` objects or dicts with the
+        `Wakis` keyword arguments where 'Ez' is the path to the Ez.h5
+        file: q, sigmaz, xsource, ysource, xtest, ytest, chargedist,
+        t, x, y, z and unit_m. For integration='indirect' 'Ez_pipe' is
+        a dict with the path 'filename' to Ez_pipe.h5 and 'a', 'phi',
+        'z', and for transverse='lorentz' 'Et' is the path to Et.h5.
+        Already solved `Wakis` objects are used as they are
+    workers : :obj: `int`, optional
+        Number of processes. Default is None, one per run up to
+        the number of cores
+    verbose : :obj: `int`, optional
+        Logger level of the runs. Default is 3, warnings
+    **kwargs :
+        Options of `Wakis.solve` for every run, e.g. engine or grid
+
+    Attributes
+    ----------
+    s, f : ndarray
+        Wake and frequency samples, shared by the runs
+    WPx, WPy : dict
+        Transverse wake potentials per unit offset [V/pC/m] with
+        keys 'dipolar', 'quadrupolar', 'driving' and 'detuning'.
+        None for a plane whose terms the offsets of the runs do
+        not determine, as in a scan along one plane only
+    Zx, Zy : dict
+        Transverse impedances per unit offset [Ohm/m], same keys
+    results : list
+        s, WP, WPx, WPy, f, Z, Zx, Zy of every run
+    '''
+
+    def __init__(self, runs, workers=None, verbose=3, **kwargs):
+
+        self.runs = runs
+        self.workers = workers
+        self.verbose = verbose
+        self.kwargs = kwargs
+        self.log = get_logger(level=verbose)
+
+        self.s, self.f = None, None
+        self.WPx, self.WPy = None, None
+        self.Zx, self.Zy = None, None
+        self.results = None
+
+    def solve(self):
+        '''
+        Solves every run and fits the dipolar and quadrupolar terms
+        of both planes for every s and every frequency
+        '''
+        offsets, self.results = _solve_runs(self.runs, self.workers, self.kwargs, self.verbose, self.log)
+        self.s, self.f = self.results[0]['s'], self.results[0]['f']
+
+        for plane, (src, test) in {'x' : (0, 2), 'y' : (1, 3)}.items():
+            P = _offset_fit(offsets[:, src], offsets[:, test])
+            if P is None:
+                # a scan in one plane only leaves the other one undetermined
+                if np.ptp(offsets[:, [src, test]]) > 0:
+                    self.log.warning('The offsets of the runs do not separate the source and test displacements in '+ \
+                                     plane+', the terms of the plane are not fitted')
+                else:
+                    self.log.info('The runs are not displaced in '+plane+', the terms of the plane are not fitted')
+                setattr(self, 'WP'+plane, None)
+                setattr(self, 'Z'+plane, None)
+                continue
+
+            for key in ['WP', 'Z']:
+                dip, quad = _fit(P, np.array([r[key+plane] for r in self.results]))
+                setattr(self, key+plane, {'dipolar' : dip, 'quadrupolar' : quad,
+                                          'driving' : dip+quad, 'detuning' : quad})
+
+        return self
+
+class Synthesis():
+    '''
+    Superposition synthesis of the wakes for arbitrary small offsets.
+    In the ultra-relativistic linear regime every result of a run is
+    a linear combination of the basis [1, xsource, ysource, xtest, ytest],
+
+        WP(s) = C_0(s) + xsource*C_1(s) + ysource*C_2(s) + xtest*C_3(s) + ytest*C_4(s)
+
+    The coefficients of WP, WPx, WPy, Z, Zx and Zy are fitted by least
+    squares once from the runs and cached, and any offset is then
+    evaluated with a single product, without reading Ez.h5 again.
+    The transverse results are linear in the offsets, WP and Z also 
+    have second order terms (xsource*xtest, xtest**2-ytest**2, ...) 
+    that the basis leaves out, small for offsets well inside the pipe
+
+    Parameters
+    ----------
+    runs : list, optional
+        Runs with their offsets, see `Decomposition`. Solved `Wakis`
+        objects are used as they are, the others are solved from 
+        their field dumps. Default is None, to `load` the coefficients
+    workers, verbose, **kwargs : optional
+        Solver options of the runs, see `Decomposition`
+    '''
+
+    keys = ['WP', 'WPx', 'WPy', 'Z', 'Zx', 'Zy']
+
+    def __init__(self, runs=None, workers=None, verbose=3, **kwargs):
+
+        self.runs = runs
+        self.workers = workers
+        self.verbose = verbose
+        self.kwargs = kwargs
+        self.log = get_logger(level=verbose)
+
+        self.s, self.f = None, None
+        self.C = None   #basis coefficients [5, ...] of every result
+
+    def fit(self):
+        '''
+        Solves the runs if needed and fits the basis coefficients
+        '''
+        offsets, results = _solve_runs(self.runs, self.workers, self.kwargs, self.verbose, self.log)
+        self.s, self.f = results[0]['s'], results[0]['f']
+
+        A = np.column_stack([np.ones(len(offsets)), offsets])
+        rank = np.linalg.matrix_rank(A)
+        if rank < A.shape[1]:
+            self.log.warning('The offsets of the '+str(len(offsets))+' runs only determine '+str(rank)+ \
+                             ' of the 5 basis coefficients, using the minimum norm fit')
+
+        P = np.linalg.pinv(A)
+        self.C = {k: np.tensordot(P, np.array([r[k] for r in results]), axes=1) for k in self.keys}
+
+        return self
+
+    def __call__(self, xsource=0.0, ysource=0.0, xtest=0.0, ytest=0.0):
+        '''
+        Wakes WP, WPx, WPy [V/pC] and impedances Z, Zx, Zy for the 
+        source and test offsets [m], returned in a dict
+        '''
+        b = np.array([1.0, xsource, ysource, xtest, ytest])
+
+        return {k: b @ C if C.ndim == 2 else np.tensordot(b, C, axes=1) for k, C in self.C.items()}
+
+    def save(self, filename='synthesis.npz'):
+        '''
+        Caches the basis coefficients in the .npz file filename
+        '''
+        np.savez(filename, s=self.s, f=self.f, **self.C)
+
+    @classmethod
+    def load(cls, filename='synthesis.npz', verbose=3):
+        '''
+        Synthesis from the coefficients cached with `save`
+        '''
+        syn = cls(verbose=verbose)
+        with np.load(filename) as d:
+            syn.s, syn.f = d['s'], d['f']
+            syn.C = {k: d[k] for k in cls.keys}
+
+        return syn
+
+def _solve_runs(runs, workers, kwargs, verbose, log):
+    '''
+    Offsets [nruns, 4] (xsource, ysource, xtest, ytest) and results 
+    of every run. Solved `Wakis` objects are taken as they are, the 
+    others are solved concurrently in a pool of processes, each one 
+    reading its Ez.h5 file once
+    '''
+    keys = ['xsource', 'ysource', 'xtest', 'ytest']
+    offsets = np.array([[run[k] if isinstance(run, dict) else getattr(run, k) for k in keys] for run in runs], dtype=float)
+
+    results = [None]*len(runs)
+    todo = []
+    for i, run in enumerate(runs):
+        if not isinstance(run, dict) and getattr(run, 'Zy', None) is not None:
+            results[i] = {k: np.asarray(getattr(run, k)) for k in ['s', 'WP', 'WPx', 'WPy', 'f', 'Z', 'Zx', 'Zy']}
+        else:
+            todo.append(i)
+
+    if len(todo):
+        specs = [_run_spec(runs[i]) for i in todo]
+        for key, option in [('Ez_pipe', ('integration', 'indirect')), ('Et', ('transverse', 'lorentz'))]:
+            if kwargs.get(option[0]) == option[1]:
+                assert all(spec.get(key) is not None for spec in specs), \
+                    AssertionError(option[0]+'="'+option[1]+'" needs the '+key+' file of every run')
+        workers = workers or min(len(specs), os.cpu_count())
+        log.info('Solving '+str(len(specs))+' runs on '+str(workers)+' processes...')
+
+        if workers > 1:
+            # fresh processes, forking is not safe once h5py or numba threads are in use
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+                solved = list(pool.map(_solve_run, specs, [kwargs]*len(specs), [verbose]*len(specs)))
+        else:
+            solved = [_solve_run(spec, kwargs, verbose) for spec in specs]
+
+        for i, r in zip(todo, solved):
+            results[i] = r
+
+    assert len({len(r['s']) for r in results}) == 1, \
+        AssertionError('Runs must share the time and z grids to be combined')
+
+    return offsets, results
+
+def _run_spec(run):
+    '''
+    Picklable description of a run: the `Wakis` keyword arguments
+    with the path to its Ez.h5 file in 'Ez', to Et.h5 in 'Et' and 
+    the Ez_pipe.h5 description with its path in 'filename'
+    '''
+    if isinstance(run, dict):
+        return dict(run)
+
+    keys = ['q', 'sigmaz', 'xsource', 'ysource', 'xtest', 'ytest', 'chargedist',
+            't', 'x', 'y', 'z', 'unit_m', 'dump_stride']
+    spec = {k: getattr(run, k) for k in keys if getattr(run, k, None) is not None}
+    spec['Ez'] = run.Ez['hf'].filename
+    if getattr(run, 'Ez_pipe', None) is not None:
+        spec['Ez_pipe'] = {k: v for k, v in run.Ez_pipe.items() if k not in ['hf', 'dataset']}
+        spec['Ez_pipe']['filename'] = run.Ez_pipe['hf'].filename
+    if getattr(run, 'Et', None) is not None:
+        spec['Et'] = run.Et['hf'].filename
+
+    return spec
+
+def _solve_run(run, kwargs, verbose):
+    '''
+    Solves one run in its own process, opening its field files
+    read-only. Returns the wakes and impedances
+    '''
+    from wakis.main import Wakis
+
+    files = {'Ez' : _open(run['Ez'])}
+    if run.get('Ez_pipe') is not None:
+        files['Ez_pipe'] = dict(run['Ez_pipe'], **_open(run['Ez_pipe']['filename']))
+        files['Ez_pipe'].pop('filename')
+    if run.get('Et') is not None:
+        files['Et'] = _open(run['Et'])
+
+    w = Wakis(**dict(run, **files, log=get_logger(level=verbose)))
+    w.solve(**kwargs)
+    for f in files.values():
+        f['hf'].close()
+
+    return {k: np.asarray(getattr(w, k)) for k in ['s', 'WP', 'WPx', 'WPy', 'f', 'Z', 'Zx', 'Zy']}
+
+def _open(filename):
+    '''
+    Opens the field file filename read-only, as `Reader.read_Ez`
+    '''
+    path, filename = os.path.split(os.path.abspath(filename))
+    hf, dataset = Reader.read_Ez(path+'/', filename)
+
+    return {'hf' : hf, 'dataset' : dataset}
+
+def _offset_fit(source, test):
+    '''
+    Pseudo-inverse of the least-squares fit of the runs to
+    [1, source, test], or [source, test] when the offsets do
+    not determine the constant term. Rows 1 and 2 of the
+    returned operator [3, nruns] give the dipolar and
+    quadrupolar terms. None when the offsets do not separate
+    the source and test displacements, as in a plane where
+    the runs are not displaced
+    '''
+    A = np.column_stack([np.ones(len(source)), source, test])
+    if np.linalg.matrix_rank(A) < 3:
+        if np.linalg.matrix_rank(A[:, 1:]) < 2:
+            return None
+        return np.vstack([np.zeros(len(source)), np.linalg.pinv(A[:, 1:])])
+
+    return np.linalg.pinv(A)
+
+def _fit(P, F):
+    '''
+    Dipolar and quadrupolar terms of the stacked results F
+    [nruns, ...] with the fit operator P of `_offset_fit`
+    '''
+    C = np.tensordot(P, F, axes=1)
+    return C[1], C[2]
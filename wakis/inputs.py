@@ -94,8 +94,8 @@ class Inputs(Reader):
             self.unit_f = unit_f  #default: GHz
             self.case = case
             self.path = path
-            self.verbose = _verbose #1: Debug, 2: Info, 3: Warning, 4: Error, 5: Critical):
-            self.log = get_logger(level=_verbose)
+            self.verbose = verbose #1: Debug, 2: Info, 3: Warning, 4: Error, 5: Critical):
+            self.log = get_logger(level=verbose)
 
     class Beam():
         ''' Class to store beam input data
@@ -126,23 +126,32 @@ class Inputs(Reader):
                      xtest = None, ytest = None, 
                      chargedist = None, solver=None, filename='warpx.dat'):
 
-            self.q = None
-            self.sigmaz = None
-            self.xsource, self.ysource = None, None
-            self.xtest, self.ytest = None, None
-            self.chargedist = None
+            self.q = q
+            self.sigmaz = sigmaz
+            self.xsource, self.ysource = xsource, ysource
+            self.xtest, self.ytest = xtest, ytest
+            self.chargedist = chargedist
             self.verbose = 2 #1: Debug, 2: Info, 3: Warning, 4: Error, 5: Critical):
             self.log = get_logger(level=self.verbose)
             self.filename = filename
             if solver == 'warpx':
-                self.initialuze_warpx()
+                self.initialize_warpx()
 
             if solver == 'cst':
                 self.initialize_cst()
 
         def initialize_warpx(self):
+            '''
+            Set the beam attributes from the WarpX output file
+            '''
+            self.__dict__.update(self.from_WarpX(self.filename).__dict__)
+
+        def initialize_cst(self):
+            '''
+            Set the charge distribution from the CST output file
+            '''
+            self.chargedist = self.from_CST(q=self.q, sigmaz=self.sigmaz, chargedist=self.filename).chargedist
 
-                                         
         @classmethod
         def from_WarpX(cls, filename = 'warpx.json'):
 
@@ -155,7 +164,7 @@ class Inputs(Reader):
                 return cls(q = d['q'], sigmaz = d['sigmaz'], 
                      xsource = d['xsource'], ysource = d['ysource'], 
                      xtest = d['xtest'], ytest = d['ytest'],
-                     chargedist = d['chargedist'], rho = d['rho'])
+                     chargedist = d['chargedist'])
 
             elif ext == 'pk' or ext == 'pickle' or ext == 'inp':
                 with open(filename, 'rb') as f:
@@ -164,7 +173,7 @@ class Inputs(Reader):
                 return cls(q = d['q'], sigmaz = d['sigmaz'], 
                      xsource = d['xsource'], ysource = d['ysource'], 
                      xtest = d['xtest'], ytest = d['ytest'], 
-                     chargedist = d['charge_dist'], rho = d['rho'])
+                     chargedist = d['charge_dist'])
 
             else:
                 get_logger(2).warning('warpx file extension not supported')
@@ -182,7 +191,7 @@ class Inputs(Reader):
                     get_logger(2).warning(f'Charge distribution file "{chargedist}" not found')
 
             return cls(q = q, sigmaz = sigmaz, 
-                     xsource = ysource, ysource = ysource, 
+                     xsource = xsource, ysource = ysource, 
                      xtest = xtest, ytest = ytest, 
                      chargedist = chargedist)
 
@@ -222,15 +231,19 @@ class Inputs(Reader):
     class Field():
 
         def __init__(self, Ez = None, t= None, x = None, y = None, z = None, 
-                     x0 = None, y0 = None, z0 = None, filename=None):
+                     x0 = None, y0 = None, z0 = None, filename=None, dump_stride = 1, Ez_pipe = None,
+                     Et = None):
 
             self.Ez = Ez
             self.t = t
+            self.dump_stride = dump_stride  #solver steps between Ez frames
+            self.Ez_pipe = Ez_pipe  #Ez on the beam pipe boundary, indirect integration
+            self.Et = Et    #Ex, Ey, Bx, By on the test line, Lorentz transverse wake
             self.x, self.y, self.z = x, y, z    #field subdomain
             self.x0, self.y0, self.z0 = x0, y0, z0 #full simulation domain
 
         @classmethod
-        def from_CST(cls, folder = '3d', filename = 'Ez.h5'):
+        def from_CST(cls, folder = '3d', filename = 'Ez.h5', dtype = 'float64'):
             '''
             Factory method for Field class that pre-processes the
             CST 3D field monitor output and saves it in .h5 file
@@ -244,6 +257,10 @@ class Inputs(Reader):
             filename : :obj: `str`, optional
                 Name of the output filename containing the Ez field matrix
 
+            dtype : :obj: `str`, optional
+                Precision of the stored Ez field, 'float64' or 'float32'.
+                Default 'float64'
+
             Returns
             -------
             Field : obj
@@ -259,7 +276,7 @@ class Inputs(Reader):
             path_3d = os.getcwd() + '/' + folder + '/'
 
             #read CST field monitor output and turn it into .h5 file
-            Reader.read_cst_3d(path, path_3d, filename)
+            t, x, y, z = Reader.read_cst_3d(path, path_3d, filename, dtype)
 
             #get field content from h5 file
             hf, dataset = Reader.read_Ez(path, filename)
@@ -268,7 +285,8 @@ class Inputs(Reader):
             return cls(Ez = {'hf' : hf, 'dataset' : dataset}, t=t, x=x, y=y, z=z)
 
         @classmethod
-        def from_WarpX(cls, path = os.getcwd() + '/', warpx_filename = 'warpx.json', Ez_filename = 'Ez.h5'):
+        def from_WarpX(cls, path = os.getcwd() + '/', warpx_filename = 'warpx.json', Ez_filename = 'Ez.h5', 
+                       Ez_pipe_filename = 'Ez_pipe.h5', Et_filename = 'Et.h5'):
             
             hf, dataset = Reader.read_Ez(path, Ez_filename)
             ext = warpx_filename.split('.')[-1]
@@ -279,7 +297,10 @@ class Inputs(Reader):
 
                 return cls(Ez = {'hf' : hf, 'dataset' : dataset}, t=d['t'], 
                             x=d['x'], y=d['y'], z=d['z'], 
-                            x0=d['x0'], y0=d['y0'], z0=['z0'])
+                            x0=d['x0'], y0=d['y0'], z0=d['z0'], 
+                            dump_stride=int(d.get('dump_stride', 1)), 
+                            Ez_pipe=cls._read_Ez_pipe(path, Ez_pipe_filename, d),
+                            Et=cls._read_Et(path, Et_filename, d))
 
             elif ext in supported_extensions:
                 with open(warpx_filename, 'rb') as f:
@@ -287,11 +308,41 @@ class Inputs(Reader):
 
                 return cls(Ez = {'hf' : hf, 'dataset' : dataset}, t=d['t'], 
                             x=d['x'], y=d['y'], z=d['z'], 
-                            x0=d['x0'], y0=d['y0'], z0=['z0'])
+                            x0=d['x0'], y0=d['y0'], z0=d['z0'], 
+                            dump_stride=int(d.get('dump_stride', 1)), 
+                            Ez_pipe=cls._read_Ez_pipe(path, Ez_pipe_filename, d),
+                            Et=cls._read_Et(path, Et_filename, d))
 
             else:
-                self.log.warning('warpx file extension not supported')
+                get_logger(2).warning('warpx file extension not supported')
+
+
+        @staticmethod
+        def _read_Ez_pipe(path, filename, d):
+            '''
+            Open the Ez_pipe.h5 file of the indirect integration
+            if the WarpX run stored it
+            '''
+            if d.get('integration', 'direct') != 'indirect':
+                return None
+
+            hf, dataset = Reader.read_Ez(path, filename)
+
+            return {'hf' : hf, 'dataset' : dataset, 'a' : float(d['pipe_radius']), 
+                    'phi' : np.array(d['phi']), 'z' : np.array(d['zpipe'])}
+
+        @staticmethod
+        def _read_Et(path, filename, d):
+            '''
+            Open the Et.h5 file of the Lorentz transverse 
+            wake if the WarpX run stored it
+            '''
+            if d.get('transverse', 'panofsky') != 'lorentz':
+                return None
+
+            hf, dataset = Reader.read_Ez(path, filename)
 
+            return {'hf' : hf, 'dataset' : dataset}
 
         @staticmethod
         def _read_Ez(path = os.getcwd() + '/', filename = 'Ez.h5'):
@@ -57,6 +57,9 @@ class Wakis(Inputs, Solver, Plot):
         self.t = None
         self.x, self.y, self.z = None, None, None    #field subdomain
         self.x0, self.y0, self.z0 = None, None, None #full simulation domain
+        self.dump_stride = 1    #solver steps between Ez frames
+        self.Ez_pipe = None     #Ez on the beam pipe boundary, indirect integration
+        self.Et = None          #Ex, Ey, Bx, By on the test line, Lorentz transverse wake
 
         #solver init
         self.s = None
@@ -64,6 +67,7 @@ class Wakis(Inputs, Solver, Plot):
         self.WP = None
         self.WP_3d = None
         self.WPx, self.WPy = None, None
+        self.WPz, self.zbins = None, None
         self.f = None
         self.Z = None
         self.Zx, self.Zy = None, None
@@ -105,11 +109,90 @@ class Wakis(Inputs, Solver, Plot):
         except:
             self.log.warning(f'"{f}" file not found')
 
-    def solve(self):
+    def solve(self, engine='numpy', grid='interp', cache=False, workers=None, memory_budget=None, state=None, 
+              i0=1, j0=1, time_interp='nearest', dtype='float64', zbins=None, mpi=False, 
+              integration='direct', scheduler=None, rule='rectangle', gradient='centered', 
+              transverse='panofsky'):
         '''
         Perform the wake potential and impedance for
         longitudinal and transverse plane and display
         calculation time
+
+        Parameters
+        ----------
+        engine : :obj: `str`, optional
+            Engine used for the wake potential integration:
+            'numpy' (vectorized), 'numba' (compiled, parallel 
+            on all cores), 'dask' (lazy task graph over the 
+            time chunks of Ez, also for a chunked dask array 
+            self.Ez) or 'loop' (reference). Default is 'numpy'
+        grid : :obj: `str`, optional
+            Longitudinal integration grid: 'interp' (field 
+            resampled on nt points) or 'native' (field monitor 
+            z grid, low memory). Default is 'interp'
+        cache : :obj: `bool` or `str`, optional
+            Cache the integration tables on disk to reuse 
+            them in later runs on the same mesh. A str sets 
+            the cache folder, tables are kept in its 'tables'
+            subfolder. Default is False
+        workers : :obj: `int`, optional
+            Number of processes to integrate the stencil 
+            points in parallel. Default is None, serial
+        memory_budget : :obj: `float`, optional
+            Memory available for the integration [bytes]. 
+            Ez is streamed from disk in time blocks when 
+            the estimated working set is larger. Default is 
+            None, always in memory
+        state : :obj: `str`, optional
+            .npz file to save the integration state. If it 
+            exists, the wake is extended with the timesteps 
+            appended to Ez.h5 since it was saved instead of 
+            recomputed from t=0. Default is None
+        i0, j0 : :obj: `int`, optional
+            Half width of the transverse stencil of field 
+            lines in No.cells for x, y. Default is 1, 3x3
+        time_interp : :obj: `str`, optional
+            Interpolation of Ez in time between frames: 
+            'nearest', 'linear' or 'cubic'. Use 'linear' or 
+            'cubic' for Ez dumped every `dump_stride` > 1 
+            steps. The s step is then dump_stride times 
+            larger. Default is 'nearest'
+        dtype : :obj: `str`, optional
+            Precision of the field buffers, 'float64' or 
+            'float32'. The wake sum is accumulated in 
+            float64. Default is 'float64'
+        zbins : :obj: `int` or list, optional
+            Number of equal z bins or bin edges [m] to keep 
+            the contribution of each segment of the structure
+            to the wake potential in self.WPz. Default is None
+        mpi : :obj: `bool`, optional
+            Split the s range across the MPI ranks, run with 
+            `mpirun -n 4 python script.py`. Results are only
+            available on rank 0. Default is False
+        integration : :obj: `str`, optional
+            'direct' along the test particle path or 'indirect' 
+            on the beam pipe boundary for structures with equal 
+            beam pipes, see `calc_long_WP_indirect`. Default 
+            is 'direct'
+        scheduler : :obj: `str` or `dask.distributed.Client`, optional
+            Dask scheduler running the task graph of engine 'dask':
+            'threads', 'processes' or a cluster client. Default is 
+            None, the dask default
+        rule : :obj: `str`, optional
+            Cumulative integration rule of the Panofsky-Wenzel 
+            running integral: 'rectangle', 'trapezoid' or 
+            'simpson'. Default is 'rectangle'
+        gradient : :obj: `str`, optional
+            Transverse gradient: 'centered' difference or 'lsq' 
+            polynomial fit over the whole i0, j0 stencil, less 
+            sensitive to PIC noise. Default is 'centered'
+        transverse : :obj: `str`, optional
+            'panofsky' derives WPx, WPy from the stencil of 
+            longitudinal wakes. 'lorentz' integrates the 
+            transverse force on the test line only, see 
+            `calc_trans_WP_lorentz`: the longitudinal wake is
+            then obtained on that line, i0 = j0 = 0. Default 
+            is 'panofsky'
         '''
         t0 = time.time()
 
@@ -117,11 +200,32 @@ class Wakis(Inputs, Solver, Plot):
         print('|   Running WAKIS   |')
         print('---------------------')
 
-        # Obtain longitudinal Wake potential
-        WP_3d, i0, j0 = Solver.calc_long_WP(self)
+        # The Lorentz force replaces the stencil around the test line
+        if transverse == 'lorentz':
+            i0, j0 = 0, 0
+        else:
+            assert i0 >= 1 and j0 >= 1, \
+                AssertionError('Panofsky-Wenzel needs the neighbours of the test line, i0 and j0 must be >= 1')
+
+        # Obtain longitudinal and transverse Wake potential
+        if integration == 'indirect':
+            WP_3d, i0, j0 = Solver.calc_long_WP_indirect(self, i0=i0, j0=j0, dtype=dtype)
+        elif state is not None:
+            WP_3d, i0, j0 = Solver.calc_long_WP_stream(self, grid=grid, i0=i0, j0=j0, state=state)
+        else:
+            # the Panofsky-Wenzel step runs in the same pass as the integration
+            WP_3d, i0, j0 = Solver.calc_long_WP(self, engine=engine, grid=grid, cache=cache, workers=workers, 
+                                                  memory_budget=memory_budget, i0=i0, j0=j0, 
+                                                  time_interp=time_interp, dtype=dtype, zbins=zbins, mpi=mpi, 
+                                                  trans=transverse != 'lorentz', rule=rule, gradient=gradient)
+            if WP_3d is None:
+                return
 
         #Obtain transverse Wake potential
-        Solver.calc_trans_WP(self,WP_3d, i0, j0)
+        if transverse == 'lorentz':
+            Solver.calc_trans_WP_lorentz(self, dtype=dtype)
+        elif integration == 'indirect' or state is not None:
+            Solver.calc_trans_WP(self, WP_3d, i0, j0, engine=engine, rule=rule, gradient=gradient)
 
         #Obtain the longitudinal impedance
         Solver.calc_long_Z(self)
@@ -129,6 +233,40 @@ class Wakis(Inputs, Solver, Plot):
         #Obtain transverse impedance
         Solver.calc_trans_Z(self)
 
+        #Run the task graph of the lazy results
+        if engine == 'dask':
+            Solver.compute(self, scheduler=scheduler)
+
+        #Elapsed time
+        t1 = time.time()
+        totalt = t1-t0
+        self.log.info('Calculation terminated in %ds' %totalt)
+
+    def solve_map(self, filename='WP_map.h5', engine='numpy', grid='interp', cache=False, memory_budget=None,
+                  time_interp='nearest', dtype='float64'):
+        '''
+        Perform the longitudinal and transverse wake potential
+        for every (x, y) cell of the stored field subvolume and 
+        save them in a chunked h5 file with datasets 'WP', 'WPx', 
+        'WPy' [nx, ny, ns], 'x', 'y' and 's'
+
+        Parameters
+        ----------
+        filename : :obj: `str`, optional
+            Output h5 file. Default is 'WP_map.h5'
+        engine, grid, cache, time_interp, dtype : optional
+            Integration options, see `solve`
+        memory_budget : :obj: `float`, optional
+            Memory available for the integration [bytes], 
+            bounds the number of x rows integrated at once.
+            Default is None, all in one pass
+        '''
+        t0 = time.time()
+
+        Solver.calc_WP_map(self, filename=filename, engine=engine, grid=grid, cache=cache, 
+                           memory_budget=memory_budget, time_interp=time_interp, 
+                           dtype=dtype)
+
         #Elapsed time
         t1 = time.time()
         totalt = t1-t0
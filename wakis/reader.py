@@ -9,6 +9,7 @@ the supported EM solvers
 '''
 
 import os
+import glob
 import json as js
 import pickle as pk
 
@@ -78,11 +79,180 @@ class Reader():
 
         return hf, dataset
 
-    def read_cst_3d(path = _cwd, path_3d = '3d', filename = 'Ez.h5'):
+    def read_Ez_prism(hf, dataset, i0 = 1, j0 = 1, ic = None, jc = None, n0 = 0, n1 = None, dtype = 'float64'):
+        '''
+        Read the Ez field in a prism of (2*i0+1, 2*j0+1) transverse 
+        cells around the center of the stored subvolume, or around
+        the cell (ic, jc) if given, for every timestep in a single 
+        sequential pass over the datasets, or for the time window 
+        [n0, n1) only
+
+        Parameters
+        ----------
+        hf : :obj: `h5py.File`
+            Opened Ez.h5 file, as returned by `read_Ez`
+        dataset : list
+            Names of the datasets in hf, one per timestep
+        i0, j0 : :obj: `int`, optional
+            Half width of the prism in No.cells for x, y. Default is 1
+        ic, jc : :obj: `int`, optional
+            Index of the center cell in x, y. Default is the center 
+            of the stored subvolume
+        n0, n1 : :obj: `int`, optional
+            First and last (excluded) timestep to read. Default is 
+            every timestep
+        dtype : :obj: `str`, optional
+            Precision of the returned array. Default is 'float64'
+
+        Returns
+        -------
+        prism : ndarray
+            Contiguous array with shape [n1-n0, 2*i0+1, 2*j0+1, nz]
+        '''
+
+        nx, ny, nz = hf.get(dataset[0]).shape
+        if ic is None: ic = nx//2
+        if jc is None: jc = ny//2
+
+        return Reader.read_Ez_block(hf, dataset, slice(ic-i0, ic+i0+1), slice(jc-j0, jc+j0+1), n0, n1, dtype)
+
+    def read_Ez_block(hf, dataset, xs = slice(None), ys = slice(None), n0 = 0, n1 = None, dtype = 'float64'):
+        '''
+        Read the Ez field in the block of cells (xs, ys) of the stored
+        subvolume for the timesteps [n0, n1), in a single sequential 
+        pass over the datasets
+
+        Parameters
+        ----------
+        hf : :obj: `h5py.File`
+            Opened Ez.h5 file, as returned by `read_Ez`
+        dataset : list
+            Names of the datasets in hf, one per timestep
+        xs, ys : :obj: `slice`, optional
+            Cells to read in x, y. Default is the whole subvolume
+        n0, n1 : :obj: `int`, optional
+            First and last (excluded) timestep to read. Default is 
+            every timestep
+        dtype : :obj: `str`, optional
+            Precision of the returned array. Default is 'float64'
+
+        Returns
+        -------
+        prism : ndarray
+            Contiguous array with shape [n1-n0, nx_s, ny_s, nz]
+        '''
+
+        nx, ny, nz = hf.get(dataset[0]).shape
+        if n1 is None: n1 = len(dataset)
+        sel = np.s_[xs, ys, :]
+
+        prism = np.empty((n1-n0, len(range(nx)[xs]), len(range(ny)[ys]), nz), dtype=dtype)
+        for n in range(n0, n1):
+            hf.get(dataset[n]).read_direct(prism[n-n0], source_sel=sel)
+
+        _log.debug('Read Ez prism with shape '+str(prism.shape))
+
+        return prism
+
+    def read_Ez_pipe(hf, dataset, dtype = 'float64'):
+        '''
+        Read the Ez field sampled on the beam pipe boundary for the
+        indirect integration, stored by warpx.py in Ez_pipe.h5 as one
+        dataset [nphi, nz] per timestep
+
+        Parameters
+        ----------
+        hf : :obj: `h5py.File`
+            Opened Ez_pipe.h5 file, as returned by `read_Ez`
+        dataset : list
+            Names of the datasets in hf, one per timestep
+        dtype : :obj: `str`, optional
+            Precision of the returned array. Default is 'float64'
+
+        Returns
+        -------
+        lines : ndarray
+            Contiguous array with shape [nt, nphi, nz]
+        '''
+
+        nphi, nz = hf.get(dataset[0]).shape
+        lines = np.empty((len(dataset), nphi, nz), dtype=dtype)
+        for n in range(len(dataset)):
+            hf.get(dataset[n]).read_direct(lines[n])
+
+        _log.debug('Read Ez on the pipe boundary with shape '+str(lines.shape))
+
+        return lines
+
+    def read_Et(hf, dataset, dtype = 'float64'):
+        '''
+        Read the transverse fields on the test line for the Lorentz 
+        transverse wake, stored by warpx.py in Et.h5 as one dataset 
+        [4, nz] per timestep with the rows Ex, Ey, Bx, By
+
+        Parameters
+        ----------
+        hf : :obj: `h5py.File`
+            Opened Et.h5 file, as returned by `read_Ez`
+        dataset : list
+            Names of the datasets in hf, one per timestep
+        dtype : :obj: `str`, optional
+            Precision of the returned array. Default is 'float64'
+
+        Returns
+        -------
+        lines : ndarray
+            Contiguous array with shape [nt, 4, nz]
+        '''
+
+        lines = np.empty((len(dataset),)+hf.get(dataset[0]).shape, dtype=dtype)
+        for n in range(len(dataset)):
+            hf.get(dataset[n]).read_direct(lines[n])
+
+        _log.debug('Read Ex, Ey, Bx, By on the test line with shape '+str(lines.shape))
+
+        return lines
+
+    def read_Ez_dask(filename, dataset, nb = 64):
+        '''
+        Lazily chunked view of the Ez field [nt, nx, ny, nz] of the 
+        datasets of Ez.h5 as a dask array. Nothing is read until the 
+        array is computed; every chunk of nb timesteps opens the file 
+        read-only, so it also runs on the process schedulers
+
+        Parameters
+        ----------
+        filename : :obj: `str`
+            Path to the Ez.h5 file
+        dataset : list
+            Names of the datasets, one per timestep
+        nb : :obj: `int`, optional
+            Timesteps per chunk. Default is 64
+        '''
+        import dask.array as da
+
+        frames = _EzFrames(filename, dataset)
+
+        return da.from_array(frames, chunks=(nb, -1, -1, -1), lock=False)
+
+    def iter_Ez_prism(hf, dataset, i0 = 1, j0 = 1, ic = None, jc = None):
+        '''
+        Generator over the timesteps of the Ez field prism, yields one
+        slice [2*i0+1, 2*j0+1, nz] per dataset in time order. See 
+        `read_Ez_prism` for the parameters
+        '''
+
+        for n in range(len(dataset)):
+            yield Reader.read_Ez_prism(hf, dataset, i0, j0, ic, jc, n0=n, n1=n+1)[0]
+
+    def read_cst_3d(path = _cwd, path_3d = '3d', filename = 'Ez.h5', dtype = 'float64'):
         '''
         Read CST 3d exports folder and store the
         Ez field information into a matrix Ez(x,y,z) 
-        for every timestep into a `.h5` file
+        for every timestep into a `.h5` file, with
+        precision dtype, 'float64' or 'float32'.
+        Returns the time t [s] and the x, y, z
+        coordinates of the field monitor
         '''  
 
         # Rename files with E-02, E-03
@@ -138,7 +308,7 @@ class Reader():
         hf = h5py.File(path+filename, 'w')
 
         # Initialize variables
-        Ez=np.zeros((n_transverse_cells, n_transverse_cells, n_longitudinal_cells))
+        Ez=np.zeros((n_transverse_cells, n_transverse_cells, n_longitudinal_cells), dtype=dtype)
         x=np.zeros((n_transverse_cells))
         y=np.zeros((n_transverse_cells))
         z=np.zeros((n_longitudinal_cells))
@@ -189,4 +359,37 @@ class Reader():
 
         #set field info
         _log.debug('Ez field is stored in a matrix with shape '+str(Ez.shape)+' in '+str(int(nsteps))+' datasets')
-        _log.info('Finished scanning files - hdf5 file'+filename+'succesfully generated')
\ No newline at end of file
+        _log.info('Finished scanning files - hdf5 file'+filename+'succesfully generated')
+
+        return np.array(t), x, y, z
+
+
+class _EzFrames():
+    '''
+    Array-like view [nt, nx, ny, nz] of the datasets of Ez.h5 for
+    `dask.array.from_array`, picklable: only the file name is stored
+    '''
+
+    def __init__(self, filename, dataset):
+        self.filename = filename
+        self.dataset = list(dataset)
+        with h5py.File(filename, 'r') as hf:
+            d = hf.get(self.dataset[0])
+            self.shape = (len(self.dataset),) + d.shape
+            self.dtype = d.dtype
+        self.ndim = len(self.shape)
+
+    def __getitem__(self, key):
+        key = key if type(key) is tuple else (key,)
+        nt = range(self.shape[0])[key[0]]
+        if type(nt) is not range:
+            return self[(slice(nt, nt+1),)+key[1:]][0]
+
+        # shape of a frame selection, without reading
+        shape = np.broadcast_to(np.zeros((), self.dtype), self.shape[1:])[key[1:]].shape
+        Ez = np.empty((len(nt),)+shape, dtype=self.dtype)
+        with h5py.File(self.filename, 'r') as hf:
+            for i, n in enumerate(nt):
+                Ez[i] = hf.get(self.dataset[n])[key[1:]]
+
+        return Ez
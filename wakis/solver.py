@@ -13,22 +13,525 @@ longitudinal and transverse planes.
 
 '''
 
+import os
+import glob
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
+import h5py
+from scipy import sparse
+
+from wakis.reader import Reader
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit, prange = None, range
+
+try:
+    import dask
+    import dask.array as da
+except ImportError:
+    dask, da = None, None
 
 c = 299792458.0 #[m/s]
 
+_cache_path = os.path.join(os.path.expanduser('~'), '.cache', 'wakis')
+_cache_size = 2e9   #max size of the table cache on disk [bytes]
+
 class Solver():
     '''Mixin class to encapsulate solver methods
     '''
 
-    def calc_long_WP(self):
+    def calc_long_WP(self, engine='numpy', grid='interp', cache=False, workers=None, memory_budget=None, i0=1, j0=1,
+                     time_interp='nearest', dtype='float64', zbins=None, mpi=False, trans=False, rule='rectangle', 
+                     gradient='centered', order=1):
         '''
         Obtains the 3d wake potential from the pre-computed Ez field from the 
         specified solver.
+
+        Parameters
+        ----------
+        engine : :obj: `str`, optional
+            Integration engine. 'numpy' builds the characteristic index
+            table (z+s)/c for every z, s at once and performs a masked 
+            gather-and-sum over the interpolated field. 'loop' is the 
+            original element by element implementation, kept as reference 
+            for verification. 'numba' runs a JIT-compiled kernel parallelized
+            over stencil points and s on all cores, falls back to 'numpy' if 
+            numba is not installed. 'dask' builds a lazy task graph of the 
+            partial wake sums of every time chunk of Ez and their reduction: 
+            the returned WP_3d is a dask array, evaluated with `compute`. 
+            self.Ez can then also be a lazily chunked array [nt, nx, ny, nz], 
+            e.g. from `dask.array.from_array`. Default is 'numpy'
+        grid : :obj: `str`, optional
+            Longitudinal grid used for the integration. 'interp' resamples 
+            the field on nt points in z, interpolated only at the entries
+            gathered from a (nt, len(s)) index table. 'native' integrates 
+            directly on the z grid of the field 
+            monitor, with memory O(nz*nt). Default is 'interp'
+        cache : :obj: `bool` or `str`, optional
+            Store the characteristic index table on disk, keyed by the 
+            grid geometry, so repeated runs on the same mesh skip its 
+            computation. A str sets the cache folder, True uses 
+            '~/.cache/wakis/'. Tables are kept in its 'tables' subfolder and
+            the least recently used are evicted when they exceed 2 Gb. 
+            Default is False
+        workers : :obj: `int`, optional
+            Number of processes used to integrate the stencil points in 
+            parallel. Each process opens Ez.h5 read-only and reads only its 
+            own field lines. Processes are spawned, so scripts need the 
+            `if __name__ == '__main__':` guard. Default is None, serial
+        memory_budget : :obj: `float`, optional
+            Memory available for the integration [bytes]. If the estimated
+            working set from len(t), len(z) and the stencil size is larger,
+            Ez is streamed from disk in time blocks sized to the budget and 
+            the partial wake sums of every block are accumulated. The result
+            is the same as the in-memory integration. Only used by the serial
+            integration. Default is None, always in memory
+        i0, j0 : :obj: `int`, optional
+            Half width of the transverse stencil of field lines around 
+            the center of the stored subvolume in No.cells for x, y. 
+            All the lines are integrated together in batched array 
+            operations. Default is 1, a 3x3 stencil
+        time_interp : :obj: `str`, optional
+            Interpolation of the field in time at t=(z+s)/c. 'nearest' 
+            takes the last stored frame, 'linear' and 'cubic' interpolate 
+            between frames, for Ez dumped every `dump_stride` solver steps:
+            frame m holds the field at (m+1/dump_stride) frame spacings. 
+            With decimated dumps use grid 'native', 'interp' resamples z on
+            as many points as frames. The s sampling follows the frames, 
+            ds = dump_stride*c*dt of the solver. The accuracy loss of a 
+            dump stride is not estimated, check it against a short run 
+            dumped at every step. Default is 'nearest'
+        dtype : :obj: `str`, optional
+            Precision of the field buffers, 'float64' or 'float32'. The 
+            wake sum is always accumulated in float64. 'float32' halves 
+            memory and I/O, enough for fields with percent-level noise. 
+            Default is 'float64'
+        zbins : :obj: `int` or list, optional
+            Number of equal z bins or bin edges [m] where the contribution
+            of each segment of the structure to the wake potential is kept, 
+            in the same integration pass. Stored in self.WPz [nbins, len(s)]
+            for the test line, with edges in self.zbins. The cumulative 
+            integral W(s; z <= zbins[b+1]) is np.cumsum(self.WPz, axis=0).
+            Not computed with workers. Default is None
+        mpi : :obj: `bool`, optional
+            Distribute the integration with mpi4py. Every rank integrates 
+            a disjoint block of s, reading only the time window of Ez.h5 
+            its block needs, and the result is gathered on rank 0. The 
+            other ranks return None. Run the script with `mpirun -n 4 python 
+            script.py`. Only time_interp 'nearest'. Default is False
+        trans : :obj: `bool`, optional
+            Also obtain the transverse wake potential self.WPx, self.WPy
+            in the same pass. Every chunk of s finished by the integration 
+            is handed to a Panofsky-Wenzel sweep, which carries the running 
+            integral in s of the stencil lines across the chunks and applies 
+            the gradient, so WP_3d is not walked again. Same result as 
+            `calc_trans_WP` after, which is used instead with workers, mpi
+            and engine 'dask'. Default is False
+        rule, gradient, order : optional
+            Running integral rule and transverse gradient of the 
+            transverse wake with trans, see `calc_trans_WP`
         '''
 
         # Read data
+        if isinstance(self.Ez, dict):
+            hf, dataset = self.Ez['hf'], self.Ez['dataset']
+            nx, ny, nz = hf.get(dataset[0]).shape
+        else:
+            # lazily chunked Ez array [nt, nx, ny, nz]
+            assert engine == 'dask', AssertionError('A lazily chunked Ez array needs engine "dask"')
+            nx, ny, nz = self.Ez.shape[1:]
+
+        assert i0 <= nx//2 and j0 <= ny//2, \
+            AssertionError('Stencil must fit in the stored subvolume of '+str(nx)+'x'+str(ny)+' cells')
+
+        if trans:
+            assert i0 >= 1 and j0 >= 1, \
+                AssertionError('Panofsky-Wenzel needs the neighbours of the test line, i0 and j0 must be >= 1')
+
+        # Set s and integration tables
+        if workers is not None: memory_budget = None
+        if mpi:
+            assert time_interp == 'nearest' and workers is None, \
+                AssertionError('mpi only supports time_interp "nearest" and no workers')
+
+        if workers is not None and zbins is not None:
+            self.log.warning('zbins are not computed with workers')
+            zbins = None
+
+        tab = self._calc_tables(engine, grid, cache, memory_budget, (2*i0+1)*(2*j0+1), time_interp, dtype, zbins, 
+                                out_of_core=mpi)
+        s = tab['s']
+        WPz_3d = None if zbins is None else np.zeros((2*i0+1, 2*j0+1, len(tab['zbins'])-1, len(s)))
+
+        # Panofsky-Wenzel sweep fed by the serial integration
+        sweep = None
+        if trans and workers is None and not mpi and tab['engine'] != 'dask':
+            sweep = _PWSweep(len(s), (2*i0+1, 2*j0+1), i0, j0, s[2]-s[1], self.x[2]-self.x[1], self.y[2]-self.y[1], 
+                             rule, self._gradient_weights(i0, j0, gradient, order), self.q*1e12)
+
+        self.log.info('Max simulated time = '+str(round(self.t[-1]*1.0e9,4))+' ns')
+        self.log.info('Wakelength = '+str(tab['WL']/self.unit_m)+' mm')
+        self.log.info('Estimated working set of the integration = '+ \
+                      str(round(_working_set(tab['engine'], grid, len(self.t), nz, len(s), (2*i0+1)*(2*j0+1), 
+                                             tab['dtype'].itemsize)/1e6, 2))+' MB')
+
+        self.log.info('Calculating longitudinal wake potential WP'+(', WPx, WPy...' if sweep is not None else '...'))
+        if workers is not None:
+            points = [(nx//2+i, ny//2+j) for i in range(-i0,i0+1,1) for j in range(-j0,j0+1,1)]
+            WP_3d = _map_points(hf.filename, dataset, points, tab, workers)
+            WP_3d = WP_3d.reshape((2*i0+1, 2*j0+1, len(s)))
+
+        elif mpi:
+            # Block of s of every rank, gathered on rank 0
+            WP_3d, WPz_3d = _integrate_mpi(hf, dataset, i0, j0, tab, WPz_3d)
+            if WP_3d is None: 
+                return None, i0, j0
+
+        elif tab['engine'] == 'dask':
+            # Lazy task graph over the time chunks of Ez
+            Ez = self.Ez if not isinstance(self.Ez, dict) else Reader.read_Ez_dask(hf.filename, dataset)
+            WP_3d = _integrate_dask(Ez, i0, j0, tab)
+
+        elif tab['nb'] is not None:
+            # Stream the Ez field prism in blocks of nb timesteps
+            WP_3d = _integrate_chunked(hf, dataset, i0, j0, tab, WPz_3d, sweep=sweep)
+
+        else:
+            # Read the Ez field prism [nt, 2*i0+1, 2*j0+1, nz] in one pass
+            prism = Reader.read_Ez_prism(hf, dataset, i0, j0, dtype=tab['dtype'])
+
+            #integral of (Ez(xtest, ytest, z, t=(s+z)/c))dz
+            WP_3d = _integrate_prism(prism, tab, WPz_3d, sweep)
+
+        WP_3d = WP_3d/(self.q*1e12)     # [V/pC]
+
+        self.s = s
+        self.WP = WP_3d[i0,j0,:]
+
+        if zbins is not None:
+            self.zbins = tab['zbins']
+            self.WPz = WPz_3d[i0,j0,:,:]/(self.q*1e12)     # [V/pC]
+
+        if sweep is not None:
+            self.WPx, self.WPy = sweep.WPx, sweep.WPy
+        elif trans:
+            self.calc_trans_WP(WP_3d, i0, j0, engine=tab['engine'], rule=rule, gradient=gradient, order=order)
+
+        return WP_3d, i0, j0
+
+    def calc_long_WP_points(self, points, engine='numpy', grid='interp', cache=False, workers=None, time_interp='nearest',
+                            dtype='float64'):
+        '''
+        Obtains the longitudinal wake potential for a list of transverse 
+        test positions inside the stored field subvolume. Each position 
+        is integrated along the closest stored field line
+
+        Parameters
+        ----------
+        points : list
+            Transverse test positions [(x, y), ...] in [m]
+        engine, grid, cache, workers, time_interp, dtype : optional
+            Integration options, see `calc_long_WP`
+
+        Returns
+        -------
+        WP : ndarray
+            Wake potential with shape [len(points), len(s)] in [V/pC]
+        '''
+
+        if engine == 'dask':
+            self.log.warning('engine "dask" is only supported by calc_long_WP, using engine "numpy" instead')
+            engine = 'numpy'
+
         hf, dataset = self.Ez['hf'], self.Ez['dataset']
+        tab = self._calc_tables(engine, grid, cache, time_interp=time_interp, dtype=dtype)
+
+        # Closest field line to every test position
+        cells = [(int(np.argmin(abs(self.x-x))), int(np.argmin(abs(self.y-y)))) for x, y in points]
+
+        self.log.info('Calculating longitudinal wake potential WP in '+str(len(cells))+' test positions...')
+        if workers is not None:
+            WP = _map_points(hf.filename, dataset, cells, tab, workers)
+
+        else:
+            WP = np.array([_integrate_prism(Reader.read_Ez_prism(hf, dataset, 0, 0, i, j, dtype=tab['dtype']), tab)[0,0] for i, j in cells])
+
+        self.s = tab['s']
+
+        return WP/(self.q*1e12)     # [V/pC]
+
+    def calc_WP_map(self, filename='WP_map.h5', engine='numpy', grid='interp', cache=False, memory_budget=None,
+                    time_interp='nearest', dtype='float64'):
+        '''
+        Obtains the longitudinal wake potential WP(x, y, s) and the 
+        transverse wake potentials WPx(x, y, s), WPy(x, y, s) for every 
+        cell of the stored field subvolume. The lines of each block of 
+        x rows are integrated in one batched pass and written to datasets
+        chunked by x row of the h5 file, together with x, y and s
+
+        Parameters
+        ----------
+        filename : :obj: `str`, optional
+            Output h5 file. Default is 'WP_map.h5'
+        engine, grid, cache, time_interp, dtype : optional
+            Integration options, see `calc_long_WP`
+        memory_budget : :obj: `float`, optional
+            Memory available for the integration [bytes], sets the 
+            number of x rows integrated together. Default is None, 
+            the whole subvolume in one pass
+        '''
+
+        if engine == 'dask':
+            self.log.warning('engine "dask" is only supported by calc_long_WP, using engine "numpy" instead')
+            engine = 'numpy'
+
+        hf, dataset = self.Ez['hf'], self.Ez['dataset']
+        nx, ny, nz = hf.get(dataset[0]).shape
+        nt = len(dataset)
+
+        tab = self._calc_tables(engine, grid, cache, time_interp=time_interp, dtype=dtype)
+        s = tab['s']
+        ns = len(s)
+
+        # x rows integrated together
+        rows = nx
+        if memory_budget is not None:
+            while rows > 1 and _working_set(tab['engine'], grid, nt, nz, ns, rows*ny, tab['dtype'].itemsize) > memory_budget:
+                rows -= 1
+
+        dx = self.x[2]-self.x[1]
+        dy = self.y[2]-self.y[1]
+        ds = s[2]-s[1]
+
+        self.log.info('Calculating the wake potential map of '+str(nx)+'x'+str(ny)+' cells in blocks of '+str(rows)+' rows...')
+        with h5py.File(filename, 'w') as out:
+            out.create_dataset('x', data=self.x)
+            out.create_dataset('y', data=self.y)
+            out.create_dataset('s', data=s)
+            WP = out.create_dataset('WP', (nx, ny, ns), dtype='f8', chunks=(1, ny, ns))
+            WPx = out.create_dataset('WPx', (nx, ny, ns), dtype='f8', chunks=(1, ny, ns))
+            WPy = out.create_dataset('WPy', (nx, ny, ns), dtype='f8', chunks=(1, ny, ns))
+
+            for r in range(0, nx, rows):
+                prism = Reader.read_Ez_block(hf, dataset, slice(r, r+rows), dtype=tab['dtype'])
+                WP[r:r+rows] = _integrate_prism(prism, tab)/(self.q*1e12)     # [V/pC]
+
+            # Panofsky-Wenzel, with one row of halo for the x gradient
+            for r in range(0, nx, rows):
+                r0, r1 = max(r-1, 0), min(r+rows+1, nx)
+                int_WP = np.cumsum(WP[r0:r1], axis=-1)*ds
+                int_WP = np.concatenate((np.zeros((r1-r0, ny, 1)), int_WP[:, :, :-1]), axis=-1)
+
+                WPx[r:r+rows] = - np.gradient(int_WP, dx, axis=0)[r-r0:r-r0+rows]
+                WPy[r:r+rows] = - np.gradient(int_WP, dy, axis=1)[r-r0:r-r0+rows]
+
+        self.s = s
+        self.log.info('Wake potential map saved in '+filename)
+
+    def calc_long_WP_stream(self, slices=None, grid='interp', i0=1, j0=1, state=None):
+        '''
+        Obtains the 3d wake potential consuming the Ez field one timestep
+        at a time with a `WakeAccumulator`, from any time-ordered iterator
+        of field slices: `Reader.iter_Ez_prism` over the datasets of Ez.h5
+        or a live producer. The result is the same as `calc_long_WP`
+
+        Parameters
+        ----------
+        slices : iterable, optional
+            Ez field slices [2*i0+1, 2*j0+1, nz] in time order. Default 
+            is None, read from the datasets of Ez.h5
+        grid : :obj: `str`, optional
+            Longitudinal integration grid, see `calc_long_WP`
+        i0, j0 : :obj: `int`, optional
+            Half width of the slices in No.cells for x, y. Default is 1
+        state : :obj: `str`, optional
+            .npz file with the integration state. If it exists, the 
+            integration resumes from its last consumed timestep: slices 
+            must start there, and by default only the datasets appended 
+            to Ez.h5 since are read. s is extended to the wake length of 
+            the current self.t with its original spacing. The state is 
+            saved back at the end, including the partial sums of the s 
+            beyond the wake length already reached by the field. 
+            Default is None
+        '''
+
+        if state is not None and os.path.exists(state):
+            acc = WakeAccumulator.load(state)
+            if acc.shape != (2*i0+1, 2*j0+1) or not np.array_equal(acc.z, self.z):
+                raise ValueError('Integration state '+state+' does not match the field geometry')
+            self.log.info('Resuming the wake integration from timestep '+str(acc.n))
+
+        else:
+            # interpolation operator only, no index table
+            tab = self._calc_tables('loop', grid)
+            acc = WakeAccumulator(self.z, tab['s'], tab['t0'], tab['dt'], tab['ti'], 
+                                  zk=tab['zk'] if grid == 'interp' else None, shape=(2*i0+1, 2*j0+1), 
+                                  stride=tab['stride'])
+
+        nt = len(self.t)
+        WL = nt*acc.dt*c - (max(self.z)-min(self.z)) - acc.ti*c
+
+        if state is not None:
+            # keep every s whose characteristic starts within self.t
+            ds = acc.s[-1]-acc.s[-2]
+            smax = ((nt+1)*acc.dt+acc.t0-acc.ti)*c
+            acc.extend(acc.s[-1]+ds*np.arange(1, max(0, int((smax-acc.s[-1])/ds))+2))
+
+        if slices is None:
+            slices = Reader.iter_Ez_prism(self.Ez['hf'], self.Ez['dataset'][acc.n:], i0, j0)
+
+        self.log.info('Calculating longitudinal wake potential WP from a stream of Ez slices...')
+        acc.consume(slices)
+        self.log.info('Consumed '+str(acc.n)+' timesteps')
+
+        if state is not None:
+            acc.save(state)
+
+        # s with complete characteristics
+        ns = np.searchsorted(acc.s, WL, side='right')
+        WP_3d = acc.WP[:, :, :ns]/(self.q*1e12)     # [V/pC]
+
+        self.s = acc.s[:ns]
+        self.WP = WP_3d[i0,j0,:]
+
+        return WP_3d, i0, j0
+
+    def calc_long_WP_indirect(self, i0=1, j0=1, dtype='float64'):
+        '''
+        Obtains the 3d wake potential by indirect integration for structures 
+        with equal beam pipes of radius a (Napoly et al., 1993). Ez vanishes 
+        on the pipe walls, so the wake on the boundary circle r=a is the 
+        integral of Ez(a, phi, z, t=(z+s)/c) over the structure [z1, z2] only. 
+        Inside the pipe the wake is harmonic in (x, y), and the multipoles 
+        of the boundary values give it at every point of the stencil:
+
+            W(r, phi, s) = sum_m (r/a)^m [A_m(s) cos(m phi) + B_m(s) sin(m phi)]
+
+        The field record only needs to last until the test particle leaves 
+        the structure at z2, instead of crossing the whole domain. Requires 
+        self.Ez_pipe, written by warpx.py with INTEGRATION = 'indirect'
+
+        Parameters
+        ----------
+        i0, j0 : :obj: `int`, optional
+            Half width of the transverse stencil in No.cells for x, y, 
+            centered in the test position. Default is 1, 3x3
+        dtype : :obj: `str`, optional
+            Precision of the field buffer. Default is 'float64'
+        '''
+
+        assert self.Ez_pipe is not None, \
+            AssertionError('Indirect integration needs the Ez field on the beam pipe boundary, self.Ez_pipe')
+
+        hf, dataset = self.Ez_pipe['hf'], self.Ez_pipe['dataset']
+        a, phi, zp = self.Ez_pipe['a'], np.asarray(self.Ez_pipe['phi']), np.asarray(self.Ez_pipe['z'])
+
+        nx, ny = len(self.x), len(self.y)
+        assert i0 <= nx//2 and j0 <= ny//2, \
+            AssertionError('Stencil must fit in the stored subvolume of '+str(nx)+'x'+str(ny)+' cells')
+
+        # Ez_pipe is interpolated on r=a from the mesh nodes
+        dh = max(abs(self.x[1]-self.x[0]) if nx > 1 else 0.0, abs(self.y[1]-self.y[0]) if ny > 1 else 0.0)
+        if dh > a/5:
+            self.log.warning('Mesh size '+str(dh/self.unit_m)+' is not well below the pipe radius '+str(a/self.unit_m)+ \
+                             ', the multipoles of the boundary wake have errors of order dh/a')
+
+        # Aux variables, time reference as in `_calc_tables`
+        nt = len(self.t)
+        dt = self.t[-1]/(nt-1)
+        ti = 8.53*self.sigmaz/c 
+        zmin = min(self.z)
+
+        # Wake length reached when the test particle leaves the structure
+        WL = nt*dt*c - (max(zp)-zmin) - ti*c
+        ns_neg = int(ti/dt)
+        ns_pos = int(WL/(dt*c))
+        s = np.linspace(-ti*c, 0, ns_neg)
+        s = np.append(s, np.linspace(0, WL,  ns_pos))
+
+        self.log.info('Max simulated time = '+str(round(self.t[-1]*1.0e9,4))+' ns')
+        self.log.info('Wakelength = '+str(WL/self.unit_m)+' mm')
+        self.log.info('Calculating longitudinal wake potential WP on the beam pipe boundary...')
+
+        # Wake on the boundary circle [ns, nphi]
+        lines = Reader.read_Ez_pipe(hf, dataset, dtype=dtype)
+        WPb = _integrate_native(lines.transpose(0, 2, 1), zp, s, zmin, self.t[0], ti, dt, _z_weights(zp), 
+                                stride=self.dump_stride or 1)
+
+        # Multipole expansion to the stencil points
+        xs = self.x[nx//2-i0:nx//2+i0+1]
+        ys = self.y[ny//2-j0:ny//2+j0+1]
+        WP_3d = _harmonic_extension(WPb, phi, a, xs, ys)
+        WP_3d = WP_3d/(self.q*1e12)     # [V/pC]
+
+        self.s = s
+        self.WP = WP_3d[i0,j0,:]
+
+        return WP_3d, i0, j0
+
+    def _calc_tables(self, engine='numpy', grid='interp', cache=False, memory_budget=None, nlines=1, time_interp='nearest',
+                     dtype='float64', zbins=None, out_of_core=False):
+        '''
+        Sets the s array for the simulated wake length and precomputes 
+        the tables needed by the integration engine. Returns a dict
+        with the integration parameters, used by `_integrate_prism`.
+        If the working set of nlines field lines exceeds memory_budget, 
+        or out_of_core, sets the time block size 'nb' and the tables 
+        used by `_integrate_chunked`.
+        With zbins, sets the bin 'kbin' of every integration point
+        '''
+
+        engine_list = ['numpy', 'loop', 'numba', 'dask']
+        assert engine in engine_list, \
+            AssertionError('Engine must be one in: '+ str(engine_list))
+
+        if engine == 'numba' and njit is None:
+            self.log.warning('numba is not installed, using engine "numpy" instead')
+            engine = 'numpy'
+
+        if engine == 'dask' and da is None:
+            self.log.warning('dask is not installed, using engine "numpy" instead')
+            engine = 'numpy'
+
+        grid_list = ['interp', 'native']
+        assert grid in grid_list, \
+            AssertionError('Grid must be one in: '+ str(grid_list))
+
+        time_list = ['nearest', 'linear', 'cubic']
+        assert time_interp in time_list, \
+            AssertionError('Time interpolation must be one in: '+ str(time_list))
+
+        dtype_list = ['float64', 'float32']
+        assert np.dtype(dtype).name in dtype_list, \
+            AssertionError('dtype must be one in: '+ str(dtype_list))
+
+        stride = self.dump_stride or 1
+        if time_interp == 'nearest' and stride > 1:
+            self.log.warning('Ez dumped every '+str(stride)+' steps, time_interp "linear" or "cubic" is more accurate')
+
+        if time_interp != 'nearest' and engine == 'loop':
+            self.log.warning('engine "loop" only supports time_interp "nearest", using engine "numpy" instead')
+            engine = 'numpy'
+
+        if zbins is not None and engine == 'loop':
+            self.log.warning('engine "loop" does not compute zbins, using engine "numpy" instead')
+            engine = 'numpy'
+
+        if engine == 'dask' and (time_interp != 'nearest' or zbins is not None):
+            self.log.warning('engine "dask" only supports time_interp "nearest" without zbins, using engine "numpy" instead')
+            engine = 'numpy'
+
+        # dask integrates the time chunks of Ez as the out-of-core path
+        if engine == 'dask': out_of_core = True
+
+        if time_interp != 'nearest' and memory_budget is not None:
+            self.log.warning('chunked integration only supports time_interp "nearest", ignoring memory_budget')
+            memory_budget = None
 
         # Aux variables
         nt = len(self.t)
@@ -36,12 +539,15 @@ class Solver():
         ti = 8.53*self.sigmaz/c 
 
         nz = len(self.z)
-        dz = self.z[2]-self.z[1]
+        dz = _z_weights(self.z)         #per-cell weights of the native grid
         zmax = max(self.z)
         zmin = min(self.z)
 
         zi = np.linspace(zmin, zmax, nt)  
-        dzi = zi[2]-zi[1]                 
+        dzi = np.full(nt, zi[2]-zi[1])
+
+        if grid == 'interp' and not _is_uniform(self.z):
+            self.log.info('Non-uniform z mesh, grid "native" integrates it with per-cell weights without resampling')
 
         # Set Wake length and s
         WL = nt*dt*c - (zmax-zmin) - ti*c
@@ -50,51 +556,104 @@ class Solver():
         s = np.linspace(-ti*c, 0, ns_neg) #sets the values for negative s
         s = np.append(s, np.linspace(0, WL,  ns_pos))
 
-        self.log.info('Max simulated time = '+str(round(t[-1]*1.0e9,4))+' ns')
-        self.log.info('Wakelength = '+str(WL/unit)+' mm')
+        tab = {'engine' : engine, 'grid' : grid, 's' : s, 'WL' : WL,
+               'zmin' : zmin, 't0' : self.t[0], 'ti' : ti, 'dt' : dt, 'nb' : None,
+               'time' : time_interp, 'stride' : stride, 'dtype' : np.dtype(dtype), 'zbins' : None, 'kbin' : None}
 
-        # Initialize 
-        Ezi = np.zeros((nt,nt))     #interpolated Ez field
-        ts = np.zeros((nt, len(s))) #result of (z+s)/c for each z, s
+        itemsize = tab['dtype'].itemsize
+        size = _working_set(engine, grid, nt, nz, len(s), nlines, itemsize)
+        if out_of_core and (memory_budget is None or size <= memory_budget):
+            tab['nb'] = nt
 
-        WP = np.zeros_like(s)
-        WP_3d = np.zeros((3,3,len(s)))
+        if tab['nb'] is not None or (memory_budget is not None and size > memory_budget):
+            if tab['nb'] is None:
+                # timesteps per block: field lines and their interpolation
+                step = nlines*(nz + (0 if grid == 'native' else nt))*itemsize
+                tab['nb'] = max(1, int((memory_budget - nlines*len(s)*8)//step))
+                self.log.info('Estimated working set of '+str(round(size/1e6,2))+' MB exceeds the memory budget, '+ \
+                              'streaming Ez in blocks of '+str(tab['nb'])+' timesteps')
 
-        #choose different subvolume width [TODO]
-        i0, j0 = 1, 1    #center of the subvolume in No.cells for x, y
+            if grid == 'native':
+                tab.update(zk=self.z, dzk=dz)
+            else:
+                tab.update(zk=zi, dzk=dzi, Iz=_interp_operator(zi, self.z))
 
-        self.log.info('Calculating longitudinal wake potential WP...')
-        for i in range(-i0,i0+1,1):  
-            for j in range(-j0,j0+1,1):
+        elif grid == 'native':
+            tab.update(zk=self.z, dzk=dz, idx=np.arange(nz), w=np.zeros(nz))
 
-                # Interpolate Ez field
-                for n in range(nt):
-                    Ez = hf.get(dataset[n])
-                    Ezi[:, n] = np.interp(zi, self.z, Ez[Ez.shape[0]//2+i,Ez.shape[1]//2+j,:])  
+        elif engine == 'numba' or time_interp != 'nearest':
+            # no index table, times are computed on the fly
+            idx, w = _interp_weights(zi, self.z)
+            tab.update(zk=zi, dzk=dzi, idx=idx, w=w)
 
-                #integral of (Ez(xtest, ytest, z, t=(s+z)/c))dz
-                for n in range(len(s)):    
-                    for k in range(0, nt): 
-                        ts[k,n] = (zi[k]+s[n])/c-zmin/c-self.t[0]+ti
+        else:
+            if cache:
+                path = os.path.join(cache if type(cache) is str else _cache_path, 'tables')
+                key = _cache_key(self.t, self.z, self.sigmaz, WL, engine)
+                tables = _cache_load(path, key)
+            else:
+                tables = None
 
-                        if ts[k,n]>0.0:
-                            it = int(ts[k,n]/dt)-1                      #find index for t
-                            WP[n] = WP[n]+(Ezi[k, it])*dzi    #compute integral
+            if tables is not None:
+                self.log.info('Using cached integration tables '+key)
+                it = tables['it'] if engine == 'numpy' else None
 
-                WP = WP/(self.q*1e12)     # [V/pC]
-                WP_3d[i0+i,j0+j,:] = WP 
+            else:
+                # index table of t=(z+s)/c for each z, s
+                it = _char_index(zi, s, zmin, self.t[0], ti, dt, nt, stride) if engine == 'numpy' else None
 
-        self.s = s
-        self.WP = WP_3d[i0,j0,:]
+                if cache:
+                    _cache_save(path, key, it=it if it is not None else np.zeros(0))
 
-        return WP_3d, i0, j0
+            # the field is interpolated from z to zi only at the gathered entries
+            idx, w = _interp_weights(zi, self.z)
+            tab.update(zk=zi, dzk=dzi, idx=idx, w=w, it=it)
 
-    def calc_trans_WP(self, WP_3d, i0, j0):
+        if zbins is not None:
+            # bin of every integration point, -1 outside the edges
+            edges = np.linspace(zmin, zmax, zbins+1) if np.ndim(zbins) == 0 else np.asarray(zbins, dtype=float)
+            kbin = np.searchsorted(edges, tab['zk'], side='right')-1
+            kbin[tab['zk'] == edges[-1]] = len(edges)-2
+            kbin[np.logical_or(kbin < 0, kbin >= len(edges)-1)] = -1
+            tab.update(zbins=edges, kbin=kbin)
+
+        return tab
+
+    def calc_trans_WP(self, WP_3d, i0, j0, engine='numpy', rule='rectangle', gradient='centered', order=1):
         '''
         Obtains the transverse wake potential from the longitudinal 
-        wake potential in 3d using the Panofsky-Wenzel theorem
+        wake potential in 3d using the Panofsky-Wenzel theorem. The 
+        running integral in s and the centered gradient are obtained 
+        for every s at once, in linear time
+
+        Parameters
+        ----------
+        engine : :obj: `str`, optional
+            'dask' keeps WPx, WPy as lazy dask arrays, see `compute`.
+            Default is 'numpy'
+        rule : :obj: `str`, optional
+            Cumulative integration rule of the running integral of 
+            WP in s: 'rectangle' (sum of WP up to s excluded), 
+            'trapezoid' or 'simpson'. Default is 'rectangle'
+        gradient : :obj: `str`, optional
+            Transverse gradient at the test line. 'centered' takes the 
+            3-point centered difference of its four neighbours. 'lsq' 
+            fits a polynomial in (x, y) by least squares to the whole 
+            stencil of WP_3d, e.g. 5x5 with i0=j0=2 or the full monitor 
+            patch, and differentiates it: noisy PIC fields give smoother
+            transverse wakes. Default is 'centered'
+        order : :obj: `int`, optional
+            Total order of the 'lsq' polynomial. On symmetric stencils
+            orders 1 and 2 give the same gradient. Default is 1
         '''
 
+        assert i0 >= 1 and j0 >= 1, \
+            AssertionError('Panofsky-Wenzel needs the neighbours of the test line, i0 and j0 must be >= 1')
+
+        if engine == 'dask' and da is None:
+            self.log.warning('dask is not installed, using engine "numpy" instead')
+            engine = 'numpy'
+
         self.log.info('Calculating transverse wake potential WPx, WPy...')
 
         # Obtain dx, dy, ds
@@ -102,24 +661,68 @@ class Solver():
         dy=self.y[2]-self.y[1]
         ds = self.s[2]-self.s[1]
 
-        # Initialize variables
-        WPx = np.zeros_like(self.s)
-        WPy = np.zeros_like(self.s)
-        int_WP = np.zeros_like(WP_3d)
+        if engine == 'dask':
+            WP_3d = da.asarray(WP_3d)
+
+        # Running integral and gradient
+        self.WPx, self.WPy = _pw_sweep(WP_3d, i0, j0, ds, dx, dy, rule, self._gradient_weights(i0, j0, gradient, order))
+
+    def calc_trans_WP_lorentz(self, dtype='float64'):
+        '''
+        Obtains the transverse wake potential directly from the 
+        Lorentz force on the test particle, integrated along the 
+        test line only:
+
+            WPx(s) = 1/q int (Ex - c By)(z, t=(z+s)/c) dz
+            WPy(s) = 1/q int (Ey + c Bx)(z, t=(z+s)/c) dz
+
+        No stencil of longitudinal wakes nor numerical derivative 
+        is needed, so the field monitor shrinks to one line per 
+        component. The integral runs on the native z grid of the 
+        line, on the s of the longitudinal wake. Requires self.Et, 
+        written by warpx.py with TRANSVERSE = 'lorentz'
+
+        Parameters
+        ----------
+        dtype : :obj: `str`, optional
+            Precision of the field buffer. Default is 'float64'
+        '''
 
-        # Obtain the transverse wake potential 
-        for n in range(len(s)):
-            for i in range(-i0,i0+1,1):
-                for j in range(-j0,j0+1,1):
-                    # Perform the integral
-                    int_WP[i0+i,j0+j,n]=np.sum(WP_3d[i0+i,j0+j,0:n])*ds 
+        assert self.Et is not None, \
+            AssertionError('Lorentz transverse wake needs Ex, Ey, Bx, By on the test line, self.Et')
+
+        self.log.info('Calculating transverse wake potential WPx, WPy from the Lorentz force...')
+
+        # Aux variables, time reference as in `_calc_tables`
+        nt = len(self.t)
+        dt = self.t[-1]/(nt-1)
+        ti = 8.53*self.sigmaz/c 
+
+        # Transverse force per unit charge [nt, nz, 2]
+        Et = Reader.read_Et(self.Et['hf'], self.Et['dataset'], dtype=dtype)
+        F = np.stack((Et[:, 0]-c*Et[:, 3], Et[:, 1]+c*Et[:, 2]), axis=-1)
+
+        WPt = _integrate_native(F, self.z, self.s, min(self.z), self.t[0], ti, dt, _z_weights(self.z), 
+                                stride=self.dump_stride or 1)
+        WPt = WPt/(self.q*1e12)     # [V/pC]
+
+        self.WPx, self.WPy = WPt[:, 0], WPt[:, 1]
+
+    def _gradient_weights(self, i0, j0, gradient='centered', order=1):
+        '''
+        Weights of the transverse gradient over the stencil of 
+        [2*i0+1, 2*j0+1] lines centered in the stored subvolume, 
+        see `_lsq_gradient`. None for the centered difference
+        '''
+        gradient_list = ['centered', 'lsq']
+        assert gradient in gradient_list, \
+            AssertionError('Gradient must be one in: '+ str(gradient_list))
 
-            # Perform the gradient (second order scheme)
-            WPx[n] = - (int_WP[i0+1,j0,n]-int_WP[i0-1,j0,n])/(2*dx)
-            WPy[n] = - (int_WP[i0,j0+1,n]-int_WP[i0,j0-1,n])/(2*dy)
+        if gradient == 'centered':
+            return None
 
-        self.WPx = WPx
-        self.WPy = WPy
+        nx, ny = len(self.x), len(self.y)
+        return _lsq_gradient(self.x[nx//2-i0:nx//2+i0+1], self.y[ny//2-j0:ny//2+j0+1], order)
 
     def calc_long_Z(self):
         '''
@@ -130,7 +733,7 @@ class Solver():
         self.log.info('Obtaining longitudinal impedance Z...')
 
         # setup charge distribution in s
-        self.lambdas = np.interp(self.s, self.z, self.chargedist/self.q)
+        self.lambdas = _interp_operator(self.s, self.z) @ (self.chargedist/self.q)
 
         # Set up the DFT computation
         ds = self.s[2]-self.s[1]
@@ -139,7 +742,7 @@ class Solver():
 
         # Obtain DFTs
         lambdafft = np.fft.fft(self.lambdas*c, n=N)
-        WPfft = np.fft.fft(WP*1e12, n=N)
+        WPfft = _fft(self.WP*1e12, n=N)
         ffft=np.fft.fftfreq(len(WPfft), ds/c)
 
         # Mask invalid frequencies
@@ -175,14 +778,934 @@ class Solver():
         lambdaf = lambdafft[mask]*ds
 
         # Horizontal impedance Zx⊥(w)
-        WPxfft = np.fft.fft(self.WPx*1e12, n=N)
+        WPxfft = _fft(self.WPx*1e12, n=N)
         WPxf = WPxfft[mask]*ds
 
         self.Zx = 1j * WPxf / lambdaf
 
         # Vertical impedance Zy⊥(w)
-        WPyfft = np.fft.fft(WPy*1e12, n=N)
+        WPyfft = _fft(self.WPy*1e12, n=N)
         WPyf = WPyfft[mask]*ds
 
         self.Zy = 1j * WPyf / lambdaf
 
+    def compute(self, scheduler=None):
+        '''
+        Evaluates the lazy results of engine 'dask': the wake potential 
+        WP, WPx, WPy and the impedances Z, Zx, Zy are computed together
+        in one pass over their task graph
+
+        Parameters
+        ----------
+        scheduler : :obj: `str` or `dask.distributed.Client`, optional
+            Dask scheduler: 'threads', 'processes', 'synchronous' or a 
+            cluster client. Default is None, the dask default
+        '''
+        if dask is None:
+            return
+
+        keys = ['WP', 'WPx', 'WPy', 'Z', 'Zx', 'Zy']
+        values = dask.compute(*[getattr(self, k) for k in keys], scheduler=scheduler)
+        for k, v in zip(keys, values):
+            setattr(self, k, v)
+
+
+class WakeAccumulator():
+    '''
+    Streaming wake integral. Consumes time-ordered Ez field slices one 
+    timestep at a time and adds each of them to the wake integral of 
+    every s whose characteristic t=(z+s)/c crosses that timestep. 
+    Keeps one pointer in s per z as working state, so the field is 
+    never stored and the integration can run while data is arriving
+
+    Parameters
+    ----------
+    z : ndarray
+        z grid of the field slices [m]
+    s : ndarray
+        Sorted s grid of the wake potential [m]
+    t0, dt : float
+        Time of the first slice and timestep [s]
+    ti : float
+        Injection time of the beam [s]
+    zk : ndarray, optional
+        Uniform integration grid, the slices are interpolated on it. 
+        Default is None, integration on the native z grid
+    shape : tuple, optional
+        Shape of the stencil of field lines in the slices, [*shape, nz]. 
+        Default is (), a single line
+    stride : int, optional
+        Solver steps between the slices, see `_frame_index`. Default is 1
+    '''
+
+    def __init__(self, z, s, t0, dt, ti, zk=None, shape=(), stride=1):
+
+        self.z, self.s = z, s
+        self.t0, self.dt, self.ti = t0, dt, ti
+        self.stride = int(stride)
+        self.zmin = min(z)
+        self.shape = tuple(shape)
+
+        if zk is None:
+            self.zk, self.Iz = z, None
+        else:
+            self.zk, self.Iz = zk, _interp_operator(zk, z)
+        self.dzk = _z_weights(self.zk)
+
+        self.n = 0          #timesteps consumed
+        self.WP = np.zeros(self.shape+(len(s),))
+
+        # first s of every z reaching the next timestep
+        self.p = np.array([np.searchsorted(self._index(k, slice(None)), 0) for k in range(len(self.zk))])
+
+    def _index(self, k, n):
+        '''Timestep index of t=(zk[k]+s[n])/c, as in `_char_index`'''
+        ts = (self.zk[k]+self.s[n])/c-self.zmin/c-self.t0+self.ti
+        return _frame_index(ts, self.dt, self.stride)
+
+    def update(self, Ez):
+        '''
+        Adds the field slice [*shape, nz] of the next timestep 
+        to the wake integral
+        '''
+        Ez = np.asarray(Ez, dtype=float).reshape(-1, len(self.z))
+        if self.Iz is not None:
+            Ez = (self.Iz @ Ez.T).T
+
+        # advance the pointers over the s crossing this timestep
+        p = self.p.copy()
+        ns = len(self.s)
+        while True:
+            k = np.flatnonzero(p < ns)
+            k = k[self._index(k, p[k]) <= self.n]
+            if len(k) == 0: break
+            p[k] += 1
+
+        # (k, s) pairs in z order, so every s gets its terms as in `_integrate_prism`
+        counts = p-self.p
+        k = np.repeat(np.arange(len(self.zk)), counts)
+        n = np.arange(len(k)) - np.repeat(np.cumsum(counts)-counts, counts) + np.repeat(self.p, counts)
+        WP = self.WP.reshape(-1, ns)
+        np.add.at(WP.T, n, Ez[:, k].T*self.dzk[k][:, np.newaxis])
+
+        self.p = p
+        self.n += 1
+
+    def extend(self, s):
+        '''
+        Appends samples to the s grid. Their characteristics must 
+        not have reached the consumed timesteps yet
+        '''
+        s = np.asarray(s, dtype=float)
+        if len(s) == 0: return self
+
+        ns = len(self.s)
+        if s[0] <= self.s[-1] or np.any(np.diff(s) <= 0):
+            raise ValueError('New s samples must be sorted and beyond s[-1]')
+
+        self.s = np.append(self.s, s)
+        if self._index(0, ns) < self.n:
+            self.s = self.s[:ns]
+            raise ValueError('New s samples have already started their integration')
+
+        self.WP = np.concatenate((self.WP, np.zeros(self.shape+(len(s),))), axis=-1)
+
+        return self
+
+    def save(self, path):
+        '''
+        Saves the integration state in the .npz file path
+        '''
+        with open(path, 'wb') as f:
+            np.savez(f, z=self.z, s=self.s, t0=self.t0, dt=self.dt, ti=self.ti, 
+                     zk=self.zk if self.Iz is not None else np.zeros(0), 
+                     shape=np.array(self.shape, dtype=int), stride=self.stride, n=self.n, p=self.p, WP=self.WP)
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Loads an integration state saved with `save`
+        '''
+        with np.load(path) as d:
+            acc = cls(d['z'], d['s'], float(d['t0']), float(d['dt']), float(d['ti']), 
+                      zk=d['zk'] if len(d['zk']) else None, shape=tuple(d['shape']), 
+                      stride=int(d['stride']) if 'stride' in d.files else 1)
+            acc.n, acc.p, acc.WP = int(d['n']), d['p'], d['WP']
+
+        return acc
+
+    def consume(self, slices):
+        '''
+        Adds every field slice of a time-ordered iterator
+        '''
+        for Ez in slices:
+            self.update(Ez)
+
+        return self
+
+def _interp_weights(x, xp):
+    '''
+    Left index and weight of the linear interpolation from the 
+    grid xp to the points x, fp(x) = (1-w)*fp[idx] + w*fp[idx+1]
+    '''
+    idx = np.clip(np.searchsorted(xp, x, side='right')-1, 0, len(xp)-2)
+    w = np.clip((x-xp[idx])/(xp[idx+1]-xp[idx]), 0.0, 1.0)
+
+    return idx, w
+
+def _interp_operator(x, xp):
+    '''
+    Builds the linear interpolation from the grid xp to the points x
+    as a sparse matrix [len(x), len(xp)] with two entries per row, 
+    equivalent to np.interp(x, xp, fp). The interpolation of a block
+    fp[len(xp), m] is then a single sparse-matrix product
+    '''
+    idx, w = _interp_weights(x, xp)
+
+    rows = np.repeat(np.arange(len(x)), 2)
+    cols = np.stack((idx, idx+1), axis=1).ravel()
+    vals = np.stack((1.0-w, w), axis=1).ravel()
+
+    return sparse.csr_matrix((vals, (rows, cols)), shape=(len(x), len(xp)))
+
+def _cache_key(*args):
+    '''
+    Hash of the arrays and parameters that define the integration tables
+    '''
+    h = hashlib.sha1()
+    for arg in args:
+        h.update(np.asarray(arg).tobytes())
+
+    return h.hexdigest()
+
+def _cache_load(path, key):
+    '''
+    Load the tables stored under key, or None if they are not in cache.
+    Loaded files are touched so eviction drops the least recently used
+    '''
+    file = os.path.join(path, key+'.npz')
+    if not os.path.exists(file):
+        return None
+
+    os.utime(file)
+    with np.load(file) as f:
+        return {k: f[k] for k in f.files}
+
+def _cache_save(path, key, size=_cache_size, **tables):
+    '''
+    Store the tables under key and evict the least recently used 
+    tables until they take less than size [bytes]. Only files named 
+    after a key are evicted
+    '''
+    if sum(a.nbytes for a in tables.values()) > size:
+        return
+
+    os.makedirs(path, exist_ok=True)
+    np.savez(os.path.join(path, key+'.npz'), **tables)
+
+    files = glob.glob(os.path.join(path, '[0-9a-f]'*40+'.npz'))
+    files = sorted(files, key=os.path.getmtime)
+    total = sum(os.path.getsize(f) for f in files)
+    for f in files[:-1]:
+        if total <= size: break
+        total -= os.path.getsize(f)
+        os.remove(f)
+
+def _frame_index(ts, dt, stride=1):
+    '''
+    Index of the last stored frame before the times ts [s] from the 
+    first frame. With Ez dumped every stride solver steps, frame m 
+    holds the field at (m+1/stride)*dt, as in `_integrate_time`, so 
+    the index is floor(ts/dt-1/stride). Negative before the first 
+    frame
+    '''
+    if stride == 1:
+        return (ts/dt).astype(np.int32)-1
+    return np.floor(ts/dt-1.0/stride).astype(np.int32)
+
+def _char_index(zi, s, zmin, t0, ti, dt, nt, stride=1):
+    '''
+    Builds the characteristic index table it[k,n] of the timestep
+    where the test charge at s[n] crosses zi[k], t=(zi+s)/c. 
+    Entries out of the simulated time point to index nt, masked 
+    by `_integrate_gather`
+    '''
+    ts = (zi[:, np.newaxis]+s[np.newaxis, :])/c-zmin/c-t0+ti
+    it = _frame_index(ts, dt, stride)     #find index for t
+    it[np.logical_or(ts <= 0.0, it < 0)] = nt
+
+    return it
+
+def _char_row(zk, s, tab):
+    '''
+    Raw timestep index of t=(zk+s)/c for a single z and every s, 
+    computed as in `_char_index` but without masking. Non-decreasing 
+    along s, entries in [0, nt) fall inside the simulated time
+    '''
+    ts = (zk+s)/c-tab['zmin']/c-tab['t0']+tab['ti']
+    return _frame_index(ts, tab['dt'], tab['stride'])
+
+def _is_uniform(z):
+    '''True if the spacing of the grid z is constant to rounding'''
+    return np.allclose(np.diff(z), z[2]-z[1], rtol=1e-6, atol=0.0)
+
+def _z_weights(z):
+    '''
+    Integration weight of every point of the z grid. On a uniform 
+    grid, the spacing dz at every point. On a non-uniform grid, as 
+    the graded z meshes exported by CST, (z[k+1]-z[k-1])/2 inside
+    and the spacing of the first and last cells at both ends, which 
+    reduce to dz when the grid is nearly uniform
+    '''
+    if _is_uniform(z):
+        return np.full(len(z), z[2]-z[1])
+
+    w = np.zeros(len(z))
+    w[1:-1] = (z[2:]-z[:-2])/2
+    w[0], w[-1] = z[1]-z[0], z[-1]-z[-2]
+
+    return w
+
+def _working_set(engine, grid, nt, nz, ns, nlines, itemsize=8):
+    '''
+    Estimated memory [bytes] of the in-memory integration of nlines
+    field lines: field prism, wake potential and, for the 'interp' 
+    grid, characteristic index table
+    '''
+    size = nlines*nt*nz*itemsize + nlines*ns*8
+    if grid == 'interp' and engine != 'numba':
+        size += nt*ns*4
+
+    return size
+
+def _integrate_prism(prism, tab, WPz=None, sweep=None):
+    '''
+    Wake integral along every line of the field prism [nt, nx, ny, nz]
+    with the parameters and tables of `Solver._calc_tables`. 
+    Returns the wake integral with shape [nx, ny, len(s)]. If WPz 
+    [nx, ny, nbins, len(s)] is given, it is filled in the same pass
+    with the contribution of each z bin of tab['kbin']. A `_PWSweep` 
+    receives the chunks of s as they are finished, all of them at 
+    the end for the engines 'numba' and 'loop'
+    '''
+    engine, grid, s = tab['engine'], tab['grid'], tab['s']
+    args = (tab['zk'], s, tab['zmin'], tab['t0'], tab['ti'], tab['dt'], tab['dzk'])
+    nt, nx, ny, nz = prism.shape
+
+    if engine == 'numba':
+        order = {'nearest' : 0, 'linear' : 1, 'cubic' : 3}[tab['time']]
+        kbin = tab['kbin'] if WPz is not None else np.full(len(tab['zk']), -1)
+        WP_3d, WPz_3d = _numba_long_WP(prism, tab['idx'], tab['w'], *args, order, tab['stride'], 
+                                       kbin, 0 if WPz is None else WPz.shape[2])
+        if WPz is not None: WPz[:] = WPz_3d
+        if sweep is not None: sweep.update(WP_3d.reshape(nx*ny, len(s)).T)
+        return WP_3d
+
+    kw = {'sweep' : sweep}
+    if WPz is not None:
+        kw.update(kbin=tab['kbin'], WPz=np.zeros((WPz.shape[2], len(s), nx*ny)))
+
+    lines = prism.reshape(nt, nx*ny, nz)
+
+    # the field is read at zk from the z grid, interpolated on the 'interp' grid
+    idx, w = tab['idx'], None if grid == 'native' else tab['w']
+
+    if tab['time'] != 'nearest':
+        WP = _integrate_time(lines, idx, w, *args, tab['time'], tab['stride'], **kw)
+    elif engine == 'loop':
+        it = np.broadcast_to(np.arange(nt), (len(idx), nt))
+        WP = np.array([_integrate_loop(_line_values(lines[:, l:l+1], it, idx, w)[:, :, 0], *args, tab['stride']) 
+                       for l in range(nx*ny)]).T
+        if sweep is not None: sweep.update(WP)
+    elif grid == 'native':
+        WP = _integrate_native(lines.transpose(0, 2, 1), *args, stride=tab['stride'], **kw)
+    else:
+        WP = _integrate_gather(lines, tab['it'], idx, w, tab['dzk'], **kw)
+
+    if WPz is not None:
+        WPz[:] = kw['WPz'].transpose(2, 0, 1).reshape(WPz.shape)
+
+    return WP.T.reshape(nx, ny, len(s))
+
+def _integrate_chunked(hf, dataset, i0, j0, tab, WPz=None, n0=0, n1=None, sweep=None):
+    '''
+    Out-of-core wake integral: reads the field prism in blocks of 
+    tab['nb'] timesteps and accumulates the partial sums of each block.
+    The timestep t=(z+s)/c grows with z, so every s receives its terms 
+    in the same z order as in `_integrate_prism` and the result is 
+    identical. Returns the wake integral with shape [2*i0+1, 2*j0+1, len(s)],
+    and fills the z bin contributions WPz as `_integrate_prism`. Only 
+    the timesteps [n0, n1) are read, the terms outside are dropped.
+    The s finished after every block, whose timesteps are all below 
+    its end for every z, are passed to the `_PWSweep` sweep
+    '''
+    zk, s, nb = tab['zk'], tab['s'], tab['nb']
+    if n1 is None: n1 = len(dataset)
+    edges = np.append(np.arange(n0, n1, max(1, nb)), n1)
+
+    # range of s falling in every time block, for each z
+    bounds = np.array([np.searchsorted(_char_row(zk[k], s, tab), edges) for k in range(len(zk))])
+
+    nlines = (2*i0+1)*(2*j0+1)
+    WP = np.zeros((len(s), nlines))
+    if WPz is not None:
+        WPz_l = np.zeros((WPz.shape[2], len(s), nlines))
+
+    done = 0
+    for b in range(len(edges)-1):
+        lines = Reader.read_Ez_prism(hf, dataset, i0, j0, n0=edges[b], n1=edges[b+1], dtype=tab['dtype'])
+        _integrate_block(lines, edges[b], tab, bounds[:, b], bounds[:, b+1], WP, WPz_l if WPz is not None else None)
+
+        if sweep is not None:
+            last = len(s) if b == len(edges)-2 else np.min(bounds[:, b+1])
+            sweep.update(WP[done:last])
+            done = max(done, last)
+
+    if WPz is not None:
+        WPz[:] = WPz_l.transpose(2, 0, 1).reshape(WPz.shape)
+
+    return WP.T.reshape(2*i0+1, 2*j0+1, len(s))
+
+def _integrate_block(lines, n0, tab, lo, hi, WP=None, WPz=None):
+    '''
+    Adds the wake terms of the field lines [nb, ..., nz] of the timesteps 
+    [n0, n0+nb) to WP [len(s), nlines], in z order. lo, hi are the range 
+    of s crossing the block for every z. Fills the z bin contributions 
+    WPz [nbins, len(s), nlines]. Returns WP, new if not given
+    '''
+    zk, s, dzk = tab['zk'], tab['s'], tab['dzk']
+    nb = lines.shape[0]
+    lines = lines.reshape(nb, -1, lines.shape[-1])
+    nlines = lines.shape[1]
+    if WP is None: WP = np.zeros((len(s), nlines))
+
+    if tab['grid'] == 'native':
+        Ez = lines.transpose(2, 0, 1)
+    else:
+        Ez = (tab['Iz'].astype(lines.dtype) @ lines.reshape(nb*nlines, -1).T).reshape(-1, nb, nlines)
+
+    for k in range(len(zk)):
+        if hi[k] > lo[k]:
+            it = _char_row(zk[k], s[lo[k]:hi[k]], tab)
+            term = Ez[k, it-n0]*dzk[k]
+            WP[lo[k]:hi[k]] = WP[lo[k]:hi[k]]+term
+            if WPz is not None and tab['kbin'][k] >= 0:
+                WPz[tab['kbin'][k], lo[k]:hi[k]] += term
+
+    return WP
+
+def _integrate_dask(Ez, i0, j0, tab):
+    '''
+    Lazy wake integral of the stencil of field lines around the center 
+    of the dask array Ez [nt, nx, ny, nz]. Every time chunk of Ez is a 
+    task giving the partial wake sums of its timesteps, as a block of 
+    `_integrate_chunked`, and the partial sums are reduced by dask. 
+    Returns a dask array [2*i0+1, 2*j0+1, len(s)]
+    '''
+    nt, nx, ny, nz = Ez.shape
+    s, zk, ns = tab['s'], tab['zk'], len(tab['s'])
+    nlines = (2*i0+1)*(2*j0+1)
+
+    prism = Ez[:, nx//2-i0:nx//2+i0+1, ny//2-j0:ny//2+j0+1, :].astype(tab['dtype'])
+    if tab['nb'] < nt: 
+        prism = prism.rechunk({0: tab['nb']})
+    prism = prism.rechunk({1: -1, 2: -1, 3: -1})
+
+    # range of s falling in every time chunk, for each z
+    edges = np.append(0, np.cumsum(prism.chunks[0]))
+    bounds = np.array([np.searchsorted(_char_row(zk[k], s, tab), edges) for k in range(len(zk))])
+
+    tab_d = dask.delayed(tab, traverse=False)
+    blocks = prism.to_delayed().ravel()
+    parts = [da.from_delayed(dask.delayed(_integrate_block)(blocks[b], edges[b], tab_d, bounds[:, b], bounds[:, b+1]), 
+                             shape=(ns, nlines), dtype=float) for b in range(len(blocks))]
+
+    WP = da.stack(parts).sum(axis=0)
+
+    return WP.T.reshape(2*i0+1, 2*j0+1, ns)
+
+def _pw_sweep(WP_3d, i0, j0, ds, dx, dy, rule='rectangle', G=None):
+    '''
+    Transverse wake potential from the stencil of longitudinal wakes
+    [nx, ny, ns] with the Panofsky-Wenzel theorem. Without gradient 
+    weights G, only the four neighbours of the test line (i0, j0) are 
+    swept once in s, giving their running integral with `_cumulative` 
+    and the centered gradient. With G [2, nx, ny], the running integral
+    of every line is reduced with the weights of d/dx, d/dy in one 
+    product over all s. Lazy for a dask array. Returns WPx, WPy
+    '''
+    xp = da if da is not None and isinstance(WP_3d, da.Array) else np
+
+    if G is not None:
+        nx, ny, ns = WP_3d.shape
+        int_WP = _cumulative(WP_3d.reshape(nx*ny, ns), ds, rule)
+        grad = xp.tensordot(G.reshape(2, nx*ny), int_WP, axes=1)
+
+        return -grad[0], -grad[1]
+
+    lines = xp.stack([WP_3d[i0+1, j0], WP_3d[i0-1, j0], WP_3d[i0, j0+1], WP_3d[i0, j0-1]])
+    int_WP = _cumulative(lines, ds, rule)
+
+    WPx = - (int_WP[0]-int_WP[1])/(2*dx)
+    WPy = - (int_WP[2]-int_WP[3])/(2*dy)
+
+    return WPx, WPy
+
+class _PWSweep():
+    '''
+    Panofsky-Wenzel step fused with the wake integral. Receives the 
+    finished wake of the stencil lines for consecutive chunks of s 
+    while the integration runs, carries the running integral in s of
+    the lines it needs across the chunks, and applies the gradient to 
+    every s whose integral is complete. WPx, WPy are the same as the 
+    ones of `_pw_sweep` on the whole WP_3d, without a second pass
+
+    Parameters
+    ----------
+    ns : int
+        Number of samples of s
+    shape : tuple
+        Shape of the stencil of lines (nx, ny)
+    i0, j0, ds, dx, dy, rule, G : 
+        Test line, spacings, integration rule and gradient 
+        weights, see `_pw_sweep`
+    norm : float, optional
+        The wake chunks are divided by norm, as WP_3d before 
+        `_pw_sweep`. Default is 1
+    '''
+
+    def __init__(self, ns, shape, i0, j0, ds, dx, dy, rule='rectangle', G=None, norm=1.0):
+
+        rule_list = ['rectangle', 'trapezoid', 'simpson']
+        assert rule in rule_list, \
+            AssertionError('Integration rule must be one in: '+ str(rule_list))
+
+        if G is None:
+            # the four neighbours of the test line, in the order of `_pw_sweep`
+            self.lines = np.ravel_multi_index(([i0+1, i0-1, i0, i0], [j0, j0, j0+1, j0-1]), shape)
+        else:
+            self.lines = np.arange(shape[0]*shape[1])
+            G = G.reshape(2, -1)
+
+        self.ns, self.ds, self.dx, self.dy = ns, ds, dx, dy
+        self.rule, self.G, self.norm = rule, G, norm
+
+        self.f = np.zeros((len(self.lines), 0))     #samples kept for the next intervals
+        self.b = 0          #index in s of self.f[:, 0]
+        self.n = 0          #samples received
+        self.j = 0          #intervals integrated
+        self.m = 0          #samples of WPx, WPy filled
+        self.acc = np.zeros(len(self.lines))        #running sum of the intervals in units of ds
+
+        self.WPx, self.WPy = np.zeros(ns), np.zeros(ns)
+
+    def update(self, WP):
+        '''
+        Adds the wake [m, nlines] of the next m samples of s
+        '''
+        self.f = np.concatenate((self.f, WP[:, self.lines].T/self.norm), axis=1)
+        self.n += WP.shape[0]
+        n, ns, j = self.n, self.ns, self.j
+
+        # intervals whose samples have all arrived, as in `_cumulative`
+        if self.rule == 'rectangle':
+            q1 = n
+        elif self.rule == 'trapezoid' or n == ns:
+            q1 = n-1
+        else:
+            q1 = n-1 if (n-2) % 2 == 1 else n-2
+        q1 = max(j, min(q1, ns-1))
+
+        q = np.arange(j, q1)
+        F = lambda l: self.f[:, np.clip(q+l-self.b, 0, self.f.shape[1]-1)]
+        if self.rule == 'rectangle':
+            df = F(0)
+        elif self.rule == 'trapezoid':
+            df = (F(0)+F(1))/2
+        else:
+            fw = (5*F(0)+8*F(1)-F(2))/12
+            bw = (-F(-1)+8*F(0)+5*F(1))/12
+            df = np.where(np.logical_and(q % 2 == 0, q < ns-2), fw, bw)
+
+        # running integral of the samples m..q1, accumulated in s order
+        S = np.cumsum(np.concatenate((self.acc[:, np.newaxis], df), axis=1), axis=1)
+        int_WP = S[:, self.m-j:]*self.ds
+
+        if self.G is None:
+            WPx = - (int_WP[0]-int_WP[1])/(2*self.dx)
+            WPy = - (int_WP[2]-int_WP[3])/(2*self.dy)
+        else:
+            WPx, WPy = - np.tensordot(self.G, int_WP, axes=1)
+
+        self.WPx[self.m:q1+1], self.WPy[self.m:q1+1] = WPx, WPy
+        self.acc, self.j, self.m = S[:, -1], q1, q1+1
+
+        # keep the samples from the one before the next interval
+        self.b, self.f = max(q1-1, 0), self.f[:, max(q1-1, 0)-self.b:]
+
+        return self
+
+def _lsq_gradient(x, y, order=1):
+    '''
+    Weights [2, len(x), len(y)] of d/dx, d/dy at the center of the 
+    grid (x, y): rows of the pseudo-inverse of the least-squares fit
+    of a polynomial of total order `order` to the values on every 
+    point. The gradient of f [len(x), len(y), ...] is the weighted 
+    sum over the grid, G[0] for d/dx and G[1] for d/dy
+    '''
+    X, Y = np.meshgrid(x-x[len(x)//2], y-y[len(y)//2], indexing='ij')
+    powers = [(p, d-p) for d in range(order+1) for p in range(d, -1, -1)]
+
+    A = np.array([X.ravel()**p*Y.ravel()**q for p, q in powers]).T
+    assert order >= 1 and np.linalg.matrix_rank(A) == len(powers), \
+        AssertionError('Stencil of '+str(X.shape)+' points too small for a polynomial of order '+str(order))
+
+    P = np.linalg.pinv(A)
+
+    return P[[powers.index((1, 0)), powers.index((0, 1))]].reshape(2, len(x), len(y))
+
+def _cumulative(f, ds, rule='rectangle'):
+    '''
+    Running integral of the samples f [..., ns] with spacing ds from 
+    s[0] to every s[n], for all n at once in O(ns):
+
+    - 'rectangle': ds*sum(f[:n]), the value up to s excluded
+    - 'trapezoid': cumulative trapezoid rule
+    - 'simpson': cumulative Simpson rule. Each interval is integrated
+      with the parabola through its pair of intervals, so the even n 
+      match the composite Simpson rule. An odd last interval uses 
+      the parabola through the last three samples
+
+    Sums are accumulated in s order. Lazy for a dask array
+    '''
+    rule_list = ['rectangle', 'trapezoid', 'simpson']
+    assert rule in rule_list, \
+        AssertionError('Integration rule must be one in: '+ str(rule_list))
+
+    xp = da if da is not None and isinstance(f, da.Array) else np
+
+    # integral of every interval in units of ds
+    if rule == 'rectangle':
+        df = f[..., :-1]
+    elif rule == 'trapezoid':
+        df = (f[..., :-1]+f[..., 1:])/2
+    else:
+        # interval n from the parabola through n, n+1, n+2 (even n) or n-1, n, n+1 (odd n)
+        fw = (5*f[..., :-2]+8*f[..., 1:-1]-f[..., 2:])/12
+        bw = (-f[..., :-2]+8*f[..., 1:-1]+5*f[..., 2:])/12
+        even = np.arange(f.shape[-1]-2) % 2 == 0
+        df = xp.where(even, fw, xp.concatenate([fw[..., :1], bw[..., :-1]], axis=-1))
+        df = xp.concatenate([df, bw[..., -1:]], axis=-1)
+
+    zero = xp.zeros(f.shape[:-1]+(1,))
+    return xp.concatenate([zero, xp.cumsum(df, axis=-1)], axis=-1)*ds
+
+def _fft(a, n):
+    '''
+    FFT of length n of a numpy array, or lazy for a dask array
+    '''
+    if da is not None and isinstance(a, da.Array):
+        return da.fft.fft(a.rechunk(-1), n=n)
+
+    return np.fft.fft(a, n=n)
+
+def _integrate_mpi(hf, dataset, i0, j0, tab, WPz=None):
+    '''
+    Wake integral of a disjoint block of s on every MPI rank, reading
+    only the time window of Ez crossed by the characteristics of the 
+    block. The blocks are gathered on rank 0, which returns the wake 
+    integral [2*i0+1, 2*j0+1, len(s)] and WPz, the other ranks None
+    '''
+    from mpi4py import MPI
+
+    comm = MPI.COMM_WORLD
+    rank, size = comm.Get_rank(), comm.Get_size()
+
+    zk, s = tab['zk'], tab['s']
+    nt = len(dataset)
+    edges = np.linspace(0, len(s), size+1).astype(int)
+    a, b = edges[rank], edges[rank+1]
+
+    # timesteps crossed by t=(z+s)/c for the s of this rank
+    n0, n1 = 0, 0
+    if b > a:
+        n0 = min(max(_char_row(zk[0], s[a:a+1], tab)[0], 0), nt)
+        n1 = min(max(_char_row(zk[-1], s[b-1:b], tab)[0]+1, n0), nt)
+
+    WPz_r = None if WPz is None else np.zeros(WPz.shape[:3]+(b-a,))
+    WP_r = _integrate_chunked(hf, dataset, i0, j0, dict(tab, s=s[a:b]), WPz_r, n0, n1)
+
+    blocks = comm.gather((WP_r, WPz_r), root=0)
+    if rank != 0:
+        return None, None
+
+    WP_3d = np.concatenate([WP for WP, _ in blocks], axis=-1)
+    if WPz is not None:
+        WPz[:] = np.concatenate([WPz_r for _, WPz_r in blocks], axis=-1)
+
+    return WP_3d, WPz
+
+def _map_points(filename, dataset, points, tab, workers):
+    '''
+    Wake integral along the field lines of the cells in points [(i, j), ...]
+    distributed over a pool of processes. Every process opens the Ez file 
+    read-only and reads its own lines. The dense index table is not sent,
+    every process builds its own. Returns [len(points), len(s)]
+    '''
+    rebuild = tab.get('it') is not None
+    if rebuild: tab = dict(tab, it=None)
+
+    # fresh processes, forking is not safe once h5py or numba threads are in use
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_pool_init, initargs=(filename, dataset, tab, rebuild)) as pool:
+        WP = list(pool.map(_pool_WP, points))
+
+    return np.array(WP)
+
+def _pool_init(filename, dataset, tab, rebuild=False):
+    global _pool
+    if rebuild:
+        tab = dict(tab, it=_char_index(tab['zk'], tab['s'], tab['zmin'], tab['t0'], tab['ti'], tab['dt'], len(dataset), 
+                                       tab['stride']))
+    _pool = {'hf' : h5py.File(filename, 'r'), 'dataset' : dataset, 'tab' : tab}
+
+def _pool_WP(point):
+    prism = Reader.read_Ez_prism(_pool['hf'], _pool['dataset'], 0, 0, point[0], point[1], dtype=_pool['tab']['dtype'])
+    return _integrate_prism(prism, _pool['tab'])[0, 0]
+
+def _line_values(lines, it, idx, w=None):
+    '''
+    Field of the lines [nt, nlines, nz] at the timesteps it [nzk, m] 
+    of every integration point zk. Without w, zk[k] is the grid point
+    idx[k]. With w, the field is linearly interpolated between idx[k] 
+    and idx[k]+1 with the weights of `_interp_weights`, as the sparse
+    product of `_interp_operator`. Returns [nzk, m, nlines]
+    '''
+    k = idx[:, np.newaxis]
+    if w is None:
+        return lines[it, :, k]
+
+    w0 = (1.0-w).astype(lines.dtype)[:, np.newaxis, np.newaxis]
+    w1 = w.astype(lines.dtype)[:, np.newaxis, np.newaxis]
+
+    return w0*lines[it, :, k] + w1*lines[it, :, k+1]
+
+def _integrate_gather(lines, it, idx, w, dzi, chunk=2**20, kbin=None, WPz=None, sweep=None):
+    '''
+    Masked gather-and-sum of the field lines [nt, nlines, nz] at the 
+    timesteps it[k,n] and the points zi[k], times the weights dzi[k] 
+    along z for every s. The field is interpolated from the z grid 
+    with idx, w only at the gathered entries, see `_line_values`, 
+    and entries of it out of the simulated time are masked. Columns 
+    of s are processed in chunks to bound the size of the gathered 
+    array. If WPz [nbins, ns, nlines] is given, the sum of each z bin
+    kbin[k] is also stored in it. Every finished chunk of s is passed 
+    to the `_PWSweep` sweep
+    '''
+    nt, nlines = lines.shape[:2]
+    nzi, ns = it.shape
+    dzi = dzi[:, np.newaxis, np.newaxis]
+    WP = np.zeros((ns, nlines))
+
+    step = max(1, chunk//(nzi*nlines))
+    for n in range(0, ns, step):
+        itn = it[:, n:n+step]
+        valid = (itn < nt)[:, :, np.newaxis]
+        terms = _line_values(lines, np.where(itn < nt, itn, 0), idx, w)*np.where(valid, dzi, 0.0)
+        WP[n:n+step] = np.sum(terms, axis=0, dtype=np.float64)
+        if WPz is not None:
+            _sum_bins(terms, kbin, WPz[:, n:n+step])
+        if sweep is not None:
+            sweep.update(WP[n:n+step])
+
+    return WP
+
+def _sum_bins(terms, kbin, out):
+    '''
+    Sums the terms [nzk, ...] of every z bin kbin[k] into out[bin]
+    '''
+    for b in range(out.shape[0]):
+        out[b] = np.sum(terms[kbin == b], axis=0, dtype=np.float64)
+
+def _integrate_time(lines, idx, w, zk, s, zmin, t0, ti, dt, dzk, time='linear', stride=1, chunk=2**20, kbin=None, WPz=None,
+                    sweep=None):
+    '''
+    Wake integral with the field lines [nt, nlines, nz], read at zk 
+    with idx, w as in `_integrate_gather`, interpolated in time at 
+    t=(z+s)/c between the stored frames, 'linear' or 'cubic'. With 
+    Ez dumped every stride solver steps, frame m holds the field at 
+    t0+(m+1/stride)*dt. Outside the frames the last one is repeated. 
+    Fills the z bin contributions WPz and the sweep as `_integrate_gather`
+    '''
+    nt, nlines = lines.shape[:2]
+    nzk = len(zk)
+    order = 1 if time == 'linear' else 3
+    dzk = dzk[:, np.newaxis, np.newaxis]
+    WP = np.zeros((len(s), nlines))
+
+    step = max(1, chunk//(nzk*nlines))
+    for n in range(0, len(s), step):
+        ts = (zk[:, np.newaxis]+s[np.newaxis, n:n+step])/c-zmin/c-t0+ti
+        u = ts/dt-1.0/stride            #fractional frame index
+        valid = np.logical_and(u >= 0.0, u < nt)
+        u = np.where(valid, u, 0.0)
+        it = u.astype(int)
+        f = (u-it)[:, :, np.newaxis]
+
+        Ezt = 0.0
+        for l in range(-(order//2), order//2+2):
+            Ezt = Ezt + _lagrange(f, l, order)*_line_values(lines, np.clip(it+l, 0, nt-1), idx, w)
+        Ezt = Ezt*valid.reshape(f.shape)
+
+        terms = Ezt*dzk
+        WP[n:n+step] = np.sum(terms, axis=0)
+        if WPz is not None:
+            _sum_bins(terms, kbin, WPz[:, n:n+step])
+        if sweep is not None:
+            sweep.update(WP[n:n+step])
+
+    return WP
+
+def _lagrange(f, l, order):
+    '''
+    Weight of the frame it+l for the point it+f, 0 <= f < 1, in 
+    the linear (order 1) or cubic (order 3) Lagrange interpolation
+    '''
+    if order == 1:
+        return 1.0-f if l == 0 else f
+
+    if l == -1: return -f*(f-1.0)*(f-2.0)/6.0
+    if l == 0: return (f+1.0)*(f-1.0)*(f-2.0)/2.0
+    if l == 1: return -(f+1.0)*f*(f-2.0)/2.0
+    return (f+1.0)*f*(f-1.0)/6.0
+
+def _integrate_native(line, z, s, zmin, t0, ti, dt, dz, kbin=None, WPz=None, chunk=2**16, sweep=None, stride=1):
+    '''
+    Wake integral on the native z grid of the field line [nt, nz],
+    or a batch of lines [nt, nz, ...], with the per-cell weights dz[k] 
+    of `_z_weights`. Chunks of s sized to stay in cache are integrated 
+    one z at a time, so only O(chunk) temporaries are allocated, no 
+    interpolated field nor index table is built. Fills the z bin 
+    contributions WPz and the sweep as `_integrate_gather`. Frames 
+    dumped every stride solver steps are indexed as in `_frame_index`
+    '''
+    nt = line.shape[0]
+    WP = np.zeros((len(s),)+line.shape[2:])
+
+    step = max(1, chunk//int(np.prod(line.shape[2:])))
+    for n in range(0, len(s), step):
+        WPn = WP[n:n+step]
+        for k in range(len(z)):
+            ts = (z[k]+s[n:n+step])/c-zmin/c-t0+ti
+            it = _frame_index(ts, dt, stride)   #find index for t
+            mask = np.logical_and(ts > 0.0, np.logical_and(it >= 0, it < nt))
+            term = line[it[mask], k]*dz[k]
+            WPn[mask] = WPn[mask]+term
+            if WPz is not None and kbin[k] >= 0:
+                WPz[kbin[k], n:n+step][mask] += term
+
+        if sweep is not None:
+            sweep.update(WPn)
+
+    return WP
+
+def _harmonic_extension(WPb, phi, a, x, y):
+    '''
+    Harmonic function inside the circle of radius a from its values 
+    WPb [ns, nphi] on nphi equispaced angles phi: the Fourier modes m 
+    of the boundary are extended as (r/a)^m, exact up to m < nphi/2.
+    Returns the values on the points (x, y) [len(x), len(y), ns]
+    '''
+    nphi = len(phi)
+    C = np.fft.rfft(WPb, axis=-1)/nphi
+
+    # Fourier weights of the real modes, single Nyquist mode for even nphi
+    wm = np.full(C.shape[-1], 2.0)
+    wm[0] = 1.0
+    if nphi % 2 == 0: wm[-1] = 1.0
+
+    # complex position in the pipe, relative to the first boundary angle
+    Z = (x[:, None]+1j*y[None, :])*np.exp(-1j*phi[0])/a
+    Zm = Z[..., None]**np.arange(C.shape[-1])
+
+    return np.real(np.einsum('ijm,nm->ijn', Zm*wm, C))
+
+def _integrate_loop(Ezi, zi, s, zmin, t0, ti, dt, dzi, stride=1):
+    '''
+    Reference implementation of the wake integral looping
+    over every s and z. Slow, kept for verification
+    '''
+    nt = len(zi)
+    WP = np.zeros_like(s)
+    ts = np.zeros((nt, len(s))) #result of (z+s)/c for each z, s
+
+    for n in range(len(s)):    
+        for k in range(0, nt): 
+            ts[k,n] = (zi[k]+s[n])/c-zmin/c-t0+ti
+
+            if ts[k,n]>0.0:
+                it = int(ts[k,n]/dt)-1 if stride == 1 else int(np.floor(ts[k,n]/dt-1.0/stride))   #find index for t
+                if it >= 0:
+                    WP[n] = WP[n]+(Ezi[k, it])*dzi[k]    #compute integral
+
+    return WP
+
+def _numba_long_WP(prism, idx, w, zi, s, zmin, t0, ti, dt, dzi, order, stride, kbin, nbins):
+    '''
+    Kernel of engine 'numba'. Computes the wake integral for every 
+    stencil line of the prism [nt, nx, ny, nz] and every s in parallel. 
+    The field is interpolated on the fly at zi with the weights 
+    (idx, w), so no interpolated field buffer nor index table is needed.
+    With order 1 or 3 it is also interpolated in time, see `_integrate_time`.
+    Also returns the contribution of each of the nbins z bins kbin[k]
+    '''
+    nt, nx, ny, nz = prism.shape
+    ns = len(s)
+    WP_3d = np.zeros((nx, ny, ns))
+    WPz_3d = np.zeros((nx, ny, nbins, ns))
+
+    for m in prange(nx*ny*ns):
+        i = m//(ny*ns)
+        j = (m//ns)%ny
+        n = m%ns
+
+        WP = 0.0
+        for k in range(len(zi)):
+            ts = (zi[k]+s[n])/c-zmin/c-t0+ti
+            term = 0.0
+
+            if order == 0:
+                if ts > 0.0:
+                    it = int(ts/dt)-1 if stride == 1 else int(np.floor(ts/dt-1.0/stride))   #find index for t
+                    if it >= 0 and it < nt:
+                        term = _numba_Ez(prism, it, i, j, idx[k], w[k])*dzi[k]
+                        WP = WP+term            #compute integral
+
+            else:
+                u = ts/dt-1.0/stride            #fractional frame index
+                if u >= 0.0 and u < nt:
+                    it = int(u)
+                    Ez = 0.0
+                    for l in range(-(order//2), order//2+2):
+                        itl = min(max(it+l, 0), nt-1)
+                        Ez = Ez+_numba_lagrange(u-it, l, order)*_numba_Ez(prism, itl, i, j, idx[k], w[k])
+                    term = Ez*dzi[k]
+                    WP = WP+term
+
+            if nbins > 0 and kbin[k] >= 0:
+                WPz_3d[i, j, kbin[k], n] += term
+
+        WP_3d[i, j, n] = WP
+
+    return WP_3d, WPz_3d
+
+def _numba_Ez(prism, it, i, j, idx, w):
+    Ez = prism[it, i, j, idx]
+    if w > 0.0:
+        Ez = (1.0-w)*Ez + w*prism[it, i, j, idx+1]
+    return Ez
+
+if njit is not None:
+    _numba_lagrange = njit(cache=True)(_lagrange)
+    _numba_Ez = njit(cache=True)(_numba_Ez)
+    _numba_long_WP = njit(parallel=True, cache=True)(_numba_long_WP)